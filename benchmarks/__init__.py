@@ -0,0 +1,10 @@
+"""asv benchmarks for the gathering and cleaning stages (see asv.conf.json)."""
+import os
+import sys
+
+try:
+    import cleaning_schema
+except ImportError:
+    # running straight from a working tree instead of through asv
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import cleaning_schema
@@ -0,0 +1,93 @@
+"""The notebook's row-wise implementations, copied from cleaning-student.py.
+
+They're only here so the benchmarks can compare each vectorized module
+against what it replaced; cleaning-student.py itself can't be imported.
+"""
+import re
+
+import pandas as pd
+
+
+def extract_phone(row):
+    ph_re = re.compile(r'1?\W*([2-9][0-8][0-9])\W*([2-9][0-9]{2})\W*([0-9]{4})(\se?x?t?(\d*))?')
+    found = ph_re.search(row)
+    if found:
+        return found.group()
+    else:
+        return ''
+
+
+def remove_phone_from_email(email, phone):
+    if phone in email:
+        return re.sub(phone, '', email)
+    else:
+        return email
+
+
+def format_phone(row):
+    ph_re = re.compile(r'1?\W*([2-9][0-8][0-9])\W*([2-9][0-9]{2})\W*([0-9]{4})(\se?x?t?(\d*))?')
+    found = ph_re.search(row)
+    if found:
+        area_code = found[1]
+        pre = found[2]
+        suf = found[3]
+        return("(" + area_code + ") " + pre + "-" + suf)
+    else:
+        return ''
+
+
+def split_contact(patients):
+    patients = patients[patients.contact.notna()].copy()
+    patients['phone'] = patients.apply(lambda row: extract_phone(row['contact']), axis=1)
+    patients['email'] = patients.apply(lambda row: remove_phone_from_email(row['contact'], row['phone']), axis=1)
+    patients['phone'] = patients.apply(lambda row: format_phone(row['phone']), axis=1)
+    return patients
+
+
+def split_dose(aur_dose, nov_dose):
+    if aur_dose != '-':
+        val = aur_dose.split()
+        start_dose = val[0]
+        start_dose = re.sub('u', '', start_dose)
+        end_dose = val[2]
+        end_dose = re.sub('u', '', end_dose)
+        treatment = 'auralin'
+    elif nov_dose != '-':
+        val = nov_dose.split()
+        start_dose = val[0]
+        start_dose = re.sub('u', '', start_dose)
+        end_dose = val[2]
+        end_dose = re.sub('u', '', end_dose)
+        treatment = 'novodra'
+
+    return pd.Series([treatment, int(start_dose), int(end_dose)])
+
+
+def split_doses(treat):
+    treat = treat.copy()
+    treat[['treatment', 'start_dose', 'end_dose']] = treat.apply(lambda row: split_dose(row.auralin, row.novodra),
+                                                                 axis=1)
+    return treat
+
+
+def replace_name(state_name):
+    state_abbv = dict({'California': 'CA', 'Illinois': 'IL', 'Nebraska': 'NE', 'Florida': 'FL', 'New York': 'NY'})
+    if state_name in state_abbv:
+        return state_abbv[state_name]
+    else:
+        return state_name
+
+
+def abbreviate_states(patients):
+    return patients.apply(lambda row: replace_name(row['state']), axis=1)
+
+
+def fullname_merge(treatments, adverse_reactions, patients):
+    treat = treatments.copy()
+    adverse = adverse_reactions.copy()
+    people = patients.copy()
+    treat['fullname'] = treat['given_name'] + " " + treat['surname']
+    adverse['fullname'] = adverse['given_name'] + " " + adverse['surname']
+    people['fullname'] = (people['given_name'] + " " + people['surname']).str.lower()
+    treat_adverse = pd.merge(treat, adverse, on='fullname', how='left')
+    return pd.merge(treat_adverse, people[['fullname', 'patient_id']], on='fullname', how='left')
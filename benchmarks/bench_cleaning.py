@@ -0,0 +1,123 @@
+"""Cleaning stages: reading the study tables, contact split, doses, merges, normalization."""
+import pandas as pd
+
+from cleaning_contact import split_contact
+from cleaning_dose import reshape_doses
+from cleaning_linkage import NameIndex
+from cleaning_pipeline import patients_pipeline
+from cleaning_reference import normalize_countries, normalize_states
+from cleaning_schema import load_table
+
+from . import baselines
+from .common import SCALES, check_scale, scaled_csv, scaled_frame, use_repo_data
+
+
+class ReadCSV:
+    params = (['patients', 'treatments', 'adverse_reactions'], SCALES)
+    param_names = ['table', 'scale']
+
+    def setup(self, table, scale):
+        check_scale(scale)
+        self.path = scaled_csv(table, scale)
+
+    def time_read_csv(self, table, scale):
+        pd.read_csv(self.path)
+
+    def peakmem_read_csv(self, table, scale):
+        pd.read_csv(self.path)
+
+    def time_load_table(self, table, scale):
+        load_table(table, self.path)
+
+    def peakmem_load_table(self, table, scale):
+        load_table(table, self.path)
+
+
+class ContactSplit:
+    params = SCALES
+    param_names = ['scale']
+
+    def setup(self, scale):
+        check_scale(scale)
+        self.patients = scaled_frame('patients', scale)
+
+    def time_split_contact(self, scale):
+        split_contact(self.patients['contact'])
+
+    def peakmem_split_contact(self, scale):
+        split_contact(self.patients['contact'])
+
+    def time_notebook_apply(self, scale):
+        baselines.split_contact(self.patients)
+
+
+class SplitDose:
+    params = SCALES
+    param_names = ['scale']
+
+    def setup(self, scale):
+        check_scale(scale)
+        self.treatments = scaled_frame('treatments', scale)
+
+    def time_reshape_doses(self, scale):
+        reshape_doses(self.treatments)
+
+    def peakmem_reshape_doses(self, scale):
+        reshape_doses(self.treatments)
+
+    def time_notebook_split_dose(self, scale):
+        baselines.split_doses(self.treatments)
+
+
+class Merges:
+    """Treatments scaled up, joined against the patients and reactions as bundled.
+
+    Scaling the lookup tables too would only repeat every name and turn
+    the notebook's name merges into a cross product. NameIndex.link is
+    slower than the exact fullname merge; what it buys is matching names
+    that differ in case, accents or spelling.
+    """
+    params = SCALES
+    param_names = ['scale']
+
+    def setup(self, scale):
+        check_scale(scale)
+        self.treatments = scaled_frame('treatments', scale)
+        self.adverse_reactions = scaled_frame('adverse_reactions', 1)
+        self.patients = scaled_frame('patients', 1)
+        self.index = NameIndex(self.patients)
+
+    def time_name_index_link(self, scale):
+        self.index.link(self.treatments)
+        self.index.link(self.adverse_reactions)
+
+    def peakmem_name_index_link(self, scale):
+        self.index.link(self.treatments)
+
+    def time_notebook_fullname_merge(self, scale):
+        baselines.fullname_merge(self.treatments, self.adverse_reactions, self.patients)
+
+
+class Normalize:
+    params = SCALES
+    param_names = ['scale']
+
+    def setup(self, scale):
+        check_scale(scale)
+        use_repo_data()
+        self.patients = scaled_frame('patients', scale)
+
+    def time_normalize_states(self, scale):
+        normalize_states(self.patients['state'])
+
+    def time_normalize_countries(self, scale):
+        normalize_countries(self.patients['country'])
+
+    def time_notebook_replace_name(self, scale):
+        baselines.abbreviate_states(self.patients)
+
+    def time_patients_pipeline(self, scale):
+        patients_pipeline().run(self.patients)
+
+    def peakmem_patients_pipeline(self, scale):
+        patients_pipeline().run(self.patients)
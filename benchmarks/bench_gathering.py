@@ -0,0 +1,105 @@
+"""Gathering stages: RT page extraction, Ebert review loading, and the HTTP stages against a local stub."""
+import shutil
+import tempfile
+
+from gathering_ebert import EbertCorpus
+from gathering_posters import gather_posters
+from gathering_rt import extract_rt_folder
+from gathering_wiki import resolve_lead_images
+
+from .common import SCALES, StubServer, check_scale, scaled_folder
+
+# The bundled gathering data covers 100 films
+FILMS = 100
+# Each poster is 64 KB on disk, so 10,000x (a million posters) is skipped
+MAX_POSTERS = 10000
+
+
+def _rt_copy(copy, file_name):
+    return '{}-{}'.format(copy, file_name)
+
+
+def _ebert_copy(copy, file_name):
+    # keep the <ranking>-<slug>.txt layout with a distinct ranking per copy
+    ranking, _, rest = file_name.partition('-')
+    return '{}-{}'.format(int(ranking) + copy * FILMS, rest)
+
+
+class RTExtract:
+    params = SCALES
+    param_names = ['scale']
+
+    def setup(self, scale):
+        check_scale(scale)
+        self.folder = scaled_folder('rt-html', scale, _rt_copy)
+
+    def time_extract_rt_folder(self, scale):
+        extract_rt_folder(self.folder)
+
+    def peakmem_extract_rt_folder(self, scale):
+        extract_rt_folder(self.folder)
+
+
+class EbertLoad:
+    params = SCALES
+    param_names = ['scale']
+
+    def setup(self, scale):
+        check_scale(scale)
+        self.folder = scaled_folder('ebert_reviews', scale, _ebert_copy)
+
+    def time_corpus(self, scale):
+        EbertCorpus(self.folder)
+
+    def peakmem_corpus(self, scale):
+        EbertCorpus(self.folder)
+
+    def time_bodies(self, scale):
+        for _ in EbertCorpus(self.folder).bodies():
+            pass
+
+
+class LeadImages:
+    """Batched lead image lookups against the local stub instead of Wikipedia."""
+    params = SCALES
+    param_names = ['scale']
+    timeout = 3600
+
+    def setup(self, scale):
+        check_scale(scale)
+        self.stub = StubServer()
+        self.titles = ['Film_{}'.format(i) for i in range(FILMS * scale)]
+
+    def teardown(self, scale):
+        self.stub.close()
+
+    def time_resolve_lead_images(self, scale):
+        resolve_lead_images(self.titles, api_url=self.stub.url + '/w/api.php')
+
+
+class PosterDownloads:
+    """Full poster runs against the local stub: lookups for half the titles, overrides for the rest."""
+    params = SCALES
+    param_names = ['scale']
+    timeout = 3600
+
+    def setup(self, scale):
+        check_scale(scale)
+        if FILMS * scale > MAX_POSTERS:
+            raise NotImplementedError('{} posters per repeat is too many to write'.format(FILMS * scale))
+        self.stub = StubServer()
+        self.folder = tempfile.mkdtemp()
+        self.titles = ['Film_{}'.format(i) for i in range(FILMS * scale)]
+        # overrides skip the lookup, so only the other titles go through resolve_lead_images
+        self.overrides = {title: '{}/poster/{}.png'.format(self.stub.url, i)
+                          for i, title in enumerate(self.titles) if i % 2}
+
+    def teardown(self, scale):
+        self.stub.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def time_gather_posters(self, scale):
+        gather_posters(self.titles, self.folder, overrides=self.overrides, api_url=self.stub.url + '/w/api.php')
+
+    def peakmem_gather_posters(self, scale):
+        gather_posters(self.titles, self.folder, overrides=self.overrides, api_url=self.stub.url + '/w/api.php')
@@ -0,0 +1,144 @@
+"""Shared setup for the benchmarks: scaled copies of the bundled data and a local HTTP stub.
+
+Every benchmark is parameterized on ``scale``, a multiple of the data in
+the repo: 1 runs on ``data/``, ``rt-html/`` and ``ebert_reviews/`` as
+they are, 100 and 10000 on copies built once under ``BENCH_DATA`` and
+reused by later runs. Set ``BENCH_SCALES`` (e.g. ``1,100``) to skip the
+bigger ones; skipped scales show up as n/a in the results.
+"""
+import http.server
+import json
+import os
+import tempfile
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+import cleaning_reference
+import cleaning_schema
+
+ROOT = os.path.dirname(os.path.abspath(cleaning_schema.__file__))
+BENCH_DATA = os.environ.get('BENCH_DATA', os.path.join(tempfile.gettempdir(), 'datawrangling-bench'))
+
+SCALES = [1, 100, 10000]
+ENABLED_SCALES = [int(s) for s in os.environ.get('BENCH_SCALES', ','.join(map(str, SCALES))).split(',')]
+
+
+def root_path(*parts):
+    return os.path.join(ROOT, *parts)
+
+
+def use_repo_data():
+    """Point modules that read ``data/`` relative to the working directory at this checkout."""
+    cleaning_reference.REFERENCE_DIR = root_path('data', 'reference')
+
+
+def check_scale(scale):
+    """Skip (asv treats NotImplementedError in setup as "not run") scales turned off in BENCH_SCALES."""
+    if scale not in ENABLED_SCALES:
+        raise NotImplementedError('scale {} disabled by BENCH_SCALES'.format(scale))
+
+
+def _bench_path(name):
+    os.makedirs(BENCH_DATA, exist_ok=True)
+    return os.path.join(BENCH_DATA, name)
+
+
+def scaled_csv(table, scale):
+    """Path of ``data/<table>.csv`` repeated ``scale`` times."""
+    source = root_path('data', table + '.csv')
+    if scale == 1:
+        return source
+    path = _bench_path('{}-x{}.csv'.format(table, scale))
+    if not os.path.exists(path):
+        with open(source, 'rb') as f:
+            header = f.readline()
+            body = f.read()
+        if not body.endswith(b'\n'):
+            body += b'\n'
+        with open(path + '.part', 'wb') as out:
+            out.write(header)
+            for _ in range(scale):
+                out.write(body)
+        os.replace(path + '.part', path)
+    return path
+
+
+def scaled_frame(table, scale):
+    """``data/<table>.csv`` read with plain ``read_csv`` and repeated ``scale`` times."""
+    frame = pd.read_csv(root_path('data', table + '.csv'))
+    return pd.concat([frame] * scale, ignore_index=True) if scale > 1 else frame
+
+
+def scaled_folder(folder, scale, rename):
+    """Folder with ``scale`` symlinked copies of every file in ``folder``.
+
+    ``rename(copy, file_name)`` gives the name of copy number ``copy``.
+    """
+    source = root_path(folder)
+    if scale == 1:
+        return source
+    path = _bench_path('{}-x{}'.format(folder, scale))
+    if not os.path.exists(path):
+        os.makedirs(path + '.part', exist_ok=True)
+        for file_name in os.listdir(source):
+            for copy in range(scale):
+                link = os.path.join(path + '.part', rename(copy, file_name))
+                if not os.path.exists(link):
+                    os.symlink(os.path.join(source, file_name), link)
+        os.replace(path + '.part', path)
+    return path
+
+
+# -- Local HTTP stub -----------------------------------------------------------
+
+# A PNG header (all write_poster sniffs) padded to a typical poster size
+POSTER_BYTES = b'\x89PNG\r\n\x1a\n' + bytes(64 * 1024)
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """Answers pageimages queries like the MediaWiki API and serves posters under /poster/."""
+
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out in separate writes; with Nagle on, each
+    # keep-alive response waits out the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/w/api.php':
+            titles = parse_qs(url.query)['titles'][0].split('|')
+            base = 'http://{}:{}'.format(*self.server.server_address)
+            pages = [{'title': title, 'original': {'source': '{}/poster/{}.png'.format(base, i)}}
+                     for i, title in enumerate(titles)]
+            self._send(json.dumps({'query': {'pages': pages}}).encode(), 'application/json')
+        elif url.path.startswith('/poster/'):
+            self._send(POSTER_BYTES, 'image/png')
+        else:
+            self.send_error(404)
+
+
+class StubServer:
+    """Threaded stub server on a free local port; ``url`` is its base URL."""
+
+    def __init__(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.daemon_threads = True
+        self.url = 'http://{}:{}'.format(*self.server.server_address)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
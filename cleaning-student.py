@@ -26,9 +26,28 @@ patients = pd.read_csv('data/patients.csv')
 treatments = pd.read_csv('data/treatments.csv')
 adverse_reactions = pd.read_csv('data/adverse_reactions.csv')
 
+# %%
+# Same tables with declared dtypes: zip codes stay zero-padded strings, birthdates are parsed and
+# low-cardinality columns are categoricals
+from cleaning_schema import load_table, memory_report
+
+patients_typed = load_table('patients')
+memory_report()
+
 # %% [markdown]
 # ## Assess
 
+# %% [markdown]
+# One-pass profile of each table (nulls, type conformance, quantiles, top values, distinct counts), in place of a scan per `info()`/`describe()`/`value_counts()` call.
+
+# %%
+from cleaning_profile import profile_csv, write_report
+
+profiles = {table: profile_csv('data/{}.csv'.format(table), table)
+            for table in ['patients', 'treatments', 'adverse_reactions']}
+write_report(profiles, 'profile.json')
+profiles['patients']['columns']['zip_code']
+
 # %%
 patients.head(2)
 
@@ -288,6 +307,16 @@ patients_clean.drop(columns='contact',inplace=True)
 # %%
 patients_clean.sample(20)
 
+# %% [markdown]
+# ##### Vectorized version
+# `cleaning_contact.split_contact` does the extraction, the phone-before-email fix and the phone formatting from further down in a single `str.extract` pass, which matters once the table has millions of rows.
+
+# %%
+from cleaning_contact import split_contact
+
+contacts = split_contact(patients['contact'])
+contacts.sample(5)
+
 # %% [markdown]
 # #### Three variables in two columns in `treatments` table (treatment, start dose and end dose)
 
@@ -340,6 +369,16 @@ treat.sample(5)
 # %%
 treat.sample(20)
 
+# %% [markdown]
+# ##### Vectorized version
+# `cleaning_dose.reshape_doses` does the same reshape without building a Series per row. `treatment` comes back as a categorical and the doses as small integers; rows that don't hold exactly one `<n>u - <n>u` dose are returned by index instead of raising.
+
+# %%
+from cleaning_dose import reshape_doses
+
+treat_vec, malformed_doses = reshape_doses(treatments_clean)
+malformed_doses
+
 # %% [markdown]
 # #### Adverse reaction should be part of the `treatments` table
 
@@ -739,3 +778,123 @@ patients.loc[210,'weight'] = 107.59
 patients.loc[210,'weight'] == 107.59
 
 # %%
+
+# %% [markdown]
+# ### Pipeline version
+# The row-level fixes above as registered rules (`cleaning_pipeline`). Each rule declares the columns it reads and writes, so only the changed columns are allocated instead of a `.copy()` of the whole table per step. The report shows time and peak memory per stage.
+
+# %%
+from cleaning_pipeline import patients_pipeline, treatments_pipeline
+
+patients_piped, patients_report = patients_pipeline().run(patients, measure_memory=True)
+treatments_piped, treatments_report = treatments_pipeline().run(pd.concat([treatments, treatments_cut]),
+                                                                measure_memory=True)
+patients_report
+
+# %% [markdown]
+# With a `gathering_trace.Tracer` the same run also records CPU time and peak RSS per rule, in the trace format the gathering runs use.
+
+# %%
+from gathering_trace import Tracer, summarize
+
+tracer = Tracer()
+patients_pipeline().run(patients, tracer=tracer)
+pd.DataFrame(summarize(tracer.records))
+
+# %% [markdown]
+# ### Streaming version
+# For extracts too big to load at once: `cleaning_stream` runs the row-local rules chunk by chunk into Parquet datasets partitioned on a hash of the name, then deduplicates and joins one partition at a time.
+
+# %%
+from cleaning_stream import clean_in_chunks, dedupe_pass, join_pass
+
+clean_in_chunks('patients', 'clean/patients', chunksize=100000)
+clean_in_chunks('treatments', 'clean/treatments', chunksize=100000)
+dedupe_pass('clean/patients', 'clean/patients_unique', ['given_name', 'surname', 'address'])
+join_pass('clean/treatments', 'clean/patients_unique', 'clean/treatments_patients')
+pd.read_parquet('clean/treatments_patients').head()
+
+# %% [markdown]
+# ### Multi-core version
+# `cleaning_parallel` runs the same row-local rules on partitions of the table in a process pool; partitions travel as Arrow IPC in shared memory and come back in the original order.
+
+# %%
+from cleaning_parallel import run_partitioned
+
+if __name__ == '__main__':
+    patients_parallel, partition_report = run_partitioned(patients, by='patient_id', buckets=32)
+    partition_report
+
+# %% [markdown]
+# ### Duplicates without hard-coded indexes
+# `cleaning_dedupe` finds the Jakobsen, Gersten and Taylor duplicates and the John Doe placeholder rows from blocking keys (surname + birthdate, address, email) instead of `drop(29)`, `drop(97)`, `drop(131)`.
+
+# %%
+from cleaning_dedupe import find_duplicates, drop_duplicates
+
+clusters, candidate_pairs = find_duplicates(patients)
+clusters[clusters.duplicated('cluster', keep=False) & ~clusters.placeholder]
+
+# %%
+patients_unique = drop_duplicates(patients, clusters)
+
+# %% [markdown]
+# ### Linking by normalized name
+# `cleaning_linkage` links treatments and adverse reactions to `patient_id` through a casefolded, accent-normalized name index instead of `fullname` merges; near misses like the "Dsvid" Gustafsson typo are picked up by the trigram fallback.
+
+# %%
+from cleaning_linkage import NameIndex
+
+name_index = NameIndex(patients_unique)
+treatment_links = name_index.link(pd.concat([treatments, treatments_cut], ignore_index=True))
+reaction_links = name_index.link(adverse_reactions)
+treatment_links.link.value_counts(dropna=False)
+
+# %% [markdown]
+# ### Constraint checks
+# The invariants behind the Test cells, checked in one go with `cleaning_constraints`. Each entry lists the rows that break it, so this can run after every stage.
+
+# %%
+from cleaning_constraints import patients_constraints, treatments_constraints
+
+patients_constraints().report(patients_piped)
+
+# %%
+treatments_constraints().report(treatments_piped)
+
+# %% [markdown]
+# ### Vitals repairs
+# Instead of `.loc[210,'weight']` and `.loc[4,'height']`: `cleaning_vitals` recomputes BMI for every patient and proposes the kg→lb or swapped-digit repair that makes it agree again, and does the same for HbA1c values with a 4 misread as 9. The repairs are reviewed as a table and applied in one batch to the cleaned copies.
+
+# %%
+from cleaning_vitals import find_vitals_repairs, find_hba1c_repairs, apply_repairs
+
+vitals_repairs = find_vitals_repairs(patients_piped)
+vitals_repairs
+
+# %%
+patients_piped = apply_repairs(patients_piped, vitals_repairs)
+treatments_raw = pd.concat([treatments, treatments_cut], ignore_index=True)
+hba1c_repairs = find_hba1c_repairs(treatments_raw)
+hba1c_repairs.repair.value_counts()
+
+# %% [markdown]
+# ### Reference data for state, country and zip
+# `replace_name` only knows five states. `cleaning_reference` normalizes every US state/territory and country name in one lookup per distinct value, and checks zips against the state they are recorded with; the pipeline's `abbreviate_state` rule now uses it.
+
+# %%
+from cleaning_reference import normalize_states, unmapped, zip_state_mismatches
+
+unmapped(patients.state, normalize_states(patients.state))
+
+# %%
+patients[zip_state_mismatches(patients)][['given_name', 'surname', 'city', 'state', 'zip_code']]
+
+# %% [markdown]
+# ### Synthetic data at scale
+# `cleaning_synth` writes tables shaped like the ones above, with the same defects injected at configurable rates, so the cleaning path can be load-tested at any size. The output depends only on the seed.
+
+# %%
+from cleaning_synth import generate
+
+generate('synthetic', patients=100000, seed=0)
@@ -0,0 +1,142 @@
+"""Declared table invariants for the cleaning Test steps.
+
+The Test cells of ``cleaning-student.py`` check a fix by looking at
+``sample(20)`` or with a one-off expression (the Zaitseva BMI
+recomputation, ``sum(treatments.auralin.isnull())``). A ``Constraint``
+states the invariant once, as a vectorized function returning True for the
+rows that satisfy it, and ``Constraints.check`` runs all of them over a
+table and returns the index of the violating rows per constraint.
+
+Constraints on columns a table doesn't have are skipped, so the same set
+can be checked after every pipeline stage. ``patients_constraints()`` and
+``treatments_constraints()`` hold the invariants of the cleaned tables.
+"""
+import numpy as np
+import pandas as pd
+
+from cleaning_reference import states, zip_state_mismatches
+
+
+class Constraint:
+
+    def __init__(self, name, func, columns, allow_missing=True):
+        self.name = name
+        self.func = func
+        self.columns = list(columns)
+        # if True, rows with a missing value in any of the columns pass
+        self.allow_missing = allow_missing
+
+    def __repr__(self):
+        return 'Constraint({!r}, columns={})'.format(self.name, self.columns)
+
+    def violations(self, frame):
+        """Index of the rows of ``frame`` that break the constraint."""
+        valid = pd.Series(self.func(frame[self.columns]), index=frame.index)
+        missing = frame[self.columns].isna().any(axis=1)
+        valid = valid.fillna(False).astype(bool)
+        if self.allow_missing:
+            valid |= missing
+        else:
+            valid &= ~missing
+        return frame.index[~valid.to_numpy()]
+
+
+class Constraints:
+
+    def __init__(self, constraints=()):
+        self.constraints = list(constraints)
+
+    def add(self, constraint):
+        if any(c.name == constraint.name for c in self.constraints):
+            raise ValueError('duplicate constraint name: ' + constraint.name)
+        self.constraints.append(constraint)
+        return constraint
+
+    def constraint(self, columns, allow_missing=True, name=None):
+        """Decorator registering a function as a constraint."""
+        def register(func):
+            self.add(Constraint(name or func.__name__, func, columns, allow_missing))
+            return func
+        return register
+
+    # -- common invariants ----------------------------------------------------
+
+    def not_null(self, column, name=None):
+        return self.add(Constraint(name or column + '_not_null', lambda df: df[column].notna(), [column],
+                                   allow_missing=False))
+
+    def matches(self, column, pattern, name=None):
+        return self.add(Constraint(name or column + '_format',
+                                   lambda df: df[column].astype(str).str.fullmatch(pattern), [column]))
+
+    def isin(self, column, values, name=None):
+        values = list(values)
+        return self.add(Constraint(name or column + '_values', lambda df: df[column].isin(values), [column]))
+
+    def between(self, column, low=None, high=None, name=None):
+        def check(df):
+            valid = pd.Series(True, index=df.index)
+            if low is not None:
+                valid &= df[column] >= low
+            if high is not None:
+                valid &= df[column] <= high
+            return valid
+        return self.add(Constraint(name or column + '_range', check, [column]))
+
+    def unique(self, columns, name=None):
+        columns = [columns] if isinstance(columns, str) else list(columns)
+        return self.add(Constraint(name or '_'.join(columns) + '_unique',
+                                   lambda df: ~df.duplicated(columns, keep=False), columns))
+
+    def approx(self, column, expected, inputs, tolerance, name=None):
+        """``column`` within ``tolerance`` of ``expected(frame)``, computed from ``inputs`` columns."""
+        def check(df):
+            return np.abs(df[column] - expected(df)) <= tolerance
+        return self.add(Constraint(name or column + '_formula', check, [column] + list(inputs)))
+
+    # -- checking -------------------------------------------------------------
+
+    def check(self, frame):
+        """``{name: index of violating rows}`` for every constraint ``frame`` has the columns for."""
+        return {c.name: c.violations(frame) for c in self.constraints if set(c.columns) <= set(frame.columns)}
+
+    def report(self, frame, examples=5):
+        """One row per checked constraint: number of violations and the first few row labels."""
+        rows = [{'constraint': name, 'violations': len(index), 'examples': list(index[:examples])}
+                for name, index in self.check(frame).items()]
+        return pd.DataFrame(rows, columns=['constraint', 'violations', 'examples'])
+
+    def assert_valid(self, frame):
+        broken = {name: list(index[:5]) for name, index in self.check(frame).items() if len(index)}
+        if broken:
+            raise AssertionError('constraints violated: {}'.format(broken))
+
+
+# -- Invariants of the cleaned tables ----------------------------------------
+
+def patients_constraints():
+    constraints = Constraints()
+    constraints.not_null('patient_id')
+    constraints.unique('patient_id')
+    constraints.unique(['given_name', 'surname', 'birthdate'], name='one_row_per_patient')
+    constraints.matches('zip_code', r'\d{5}')
+    constraints.isin('state', states()['code'])
+    constraints.constraint(['zip_code', 'state'], name='zip_in_state')(lambda df: ~zip_state_mismatches(df))
+    constraints.matches('phone', r'\(\d{3}\) \d{3}-\d{4}')
+    constraints.isin('assigned_sex', ['female', 'male'])
+    constraints.between('height', 48, 84)
+    # height is UInt8 in the schema, so square it as a float
+    constraints.approx('bmi', lambda df: 703 * df['weight'] / df['height'].astype('float64') ** 2,
+                       ['weight', 'height'], 0.1)
+    return constraints
+
+
+def treatments_constraints():
+    constraints = Constraints()
+    constraints.not_null('hba1c_change')
+    constraints.approx('hba1c_change', lambda df: df['hba1c_start'] - df['hba1c_end'],
+                       ['hba1c_start', 'hba1c_end'], 1e-6)
+    constraints.isin('treatment', ['auralin', 'novodra'])
+    constraints.not_null('start_dose')
+    constraints.not_null('end_dose')
+    return constraints
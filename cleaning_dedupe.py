@@ -0,0 +1,218 @@
+"""Duplicate patient detection without hard-coded row numbers.
+
+``cleaning-student.py`` finds the duplicate patients (Jakobsen, Gersten,
+Taylor) by eyeballing ``patients.address.duplicated()`` and drops them with
+``drop(29)`` and friends, which breaks on the next extract. Here candidate
+pairs come from blocking indexes instead: rows are only compared with rows
+sharing a normalized surname + birthdate, a normalized address + zip, or an
+email. Each candidate pair is scored on how many fields agree (nicknames
+like Jake/Jakob count as agreeing given names), pairs over a threshold are
+merged into clusters with union-find, and each cluster gets a survivor.
+
+Placeholder identities (the ``John Doe, 123 Main Street`` rows) are flagged
+rather than clustered into a survivor: they have a blank name or match a
+known dummy name, email, address, zip or phone. Records that merely repeat
+exactly are ordinary duplicates and keep one survivor.
+"""
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from cleaning_schema import BIRTHDATE_FORMAT, pad_zip
+
+BLOCKS = {
+    'surname_birthdate': ['surname_key', 'birthdate_key'],
+    'address': ['address_key'],
+    'email': ['email_key'],
+}
+# Points for each field that agrees between two records of a candidate pair
+WEIGHTS = {'given_name': 1, 'surname': 2, 'birthdate': 2, 'address': 2, 'email': 2, 'phone': 1, 'zip_code': 1}
+THRESHOLD = 7
+
+PLACEHOLDER_NAMES = {('john', 'doe'), ('jane', 'doe')}
+PLACEHOLDER_EMAILS = {'johndoe@email.com', 'janedoe@email.com'}
+PLACEHOLDER_ADDRESSES = {'123 main st'}
+PLACEHOLDER_ZIPS = {'00000', '11111', '12345', '99999'}
+PLACEHOLDER_PHONES = {'0000000000', '1234567890', '5555555555', '9999999999'}
+
+STREET_SUFFIXES = {'street': 'st', 'avenue': 'ave', 'road': 'rd', 'drive': 'dr', 'lane': 'ln',
+                   'boulevard': 'blvd', 'court': 'ct', 'place': 'pl', 'terrace': 'ter', 'circle': 'cir'}
+
+
+def name_key(names):
+    """Names casefolded with accents and anything but letters removed.
+
+    Letters of any script are kept (Иван, Søren, Łukasz); None only for
+    missing names or names without a single letter.
+    """
+    def key(name):
+        if not isinstance(name, str):
+            return None
+        name = unicodedata.normalize('NFKD', name)
+        name = ''.join(c for c in name if not unicodedata.combining(c)).casefold()
+        return ''.join(c for c in name if c.isalpha()) or None
+    # each distinct name is normalized once
+    codes, uniques = pd.factorize(names.astype('object'))
+    keys = np.array([key(name) for name in uniques] + [None], dtype='object')
+    return pd.Series(keys[codes], index=names.index, dtype='object')
+
+
+def address_key(addresses):
+    """Lowercase addresses with punctuation dropped and street suffixes abbreviated."""
+    words = addresses.astype('object').str.lower().str.replace(r'[^a-z0-9 ]', ' ', regex=True).str.split()
+    return words.map(lambda parts: ' '.join(STREET_SUFFIXES.get(p, p) for p in parts) if isinstance(parts, list) else None)
+
+
+def _birthdates(values):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    return pd.to_datetime(values, format=BIRTHDATE_FORMAT, errors='coerce')
+
+
+def record_keys(patients):
+    """Frame of the normalized fields the blocks and comparisons use."""
+    if 'email' in patients and 'phone' in patients:
+        email, phone = patients['email'], patients['phone']
+    else:
+        from cleaning_contact import split_contact
+        contact = split_contact(patients['contact'])
+        email, phone = contact['email'], contact['phone']
+    zip_code = pad_zip(patients['zip_code']).astype('object')
+    # None rather than pd.NA, so comparing keys gives False instead of NA
+    zip_code = zip_code.where(zip_code.notna(), None)
+    address = address_key(patients['address'])
+    return pd.DataFrame({
+        'given_key': name_key(patients['given_name']),
+        'surname_key': name_key(patients['surname']),
+        'birthdate_key': _birthdates(patients['birthdate']).dt.strftime('%Y-%m-%d'),
+        'address_key': (address + ' ' + zip_code).where(address.notna()),
+        'street_key': address,
+        'email_key': email.astype('object').str.lower(),
+        'phone_key': phone.astype('object').str.replace(r'\D', '', regex=True),
+        'zip_key': zip_code,
+    }, index=patients.index)
+
+
+def candidate_pairs(keys, blocks=BLOCKS, max_block=50):
+    """Positional ``(left, right)`` arrays of the row pairs sharing any block.
+
+    Blocks bigger than ``max_block`` are skipped; a block that big is a
+    placeholder value, not a person.
+    """
+    left, right = [], []
+    for columns in blocks.values():
+        block = keys[columns]
+        valid = block.notna().all(axis=1).to_numpy()
+        codes = np.full(len(keys), -1)
+        codes[valid] = block[valid].groupby(columns, sort=False).ngroup().to_numpy()
+        sizes = np.bincount(codes[valid]) if valid.any() else np.array([], dtype=int)
+        for code in np.flatnonzero((sizes > 1) & (sizes <= max_block)):
+            members = np.flatnonzero(codes == code)
+            i, j = np.triu_indices(len(members), k=1)
+            left.append(members[i])
+            right.append(members[j])
+    if not left:
+        return np.array([], dtype=int), np.array([], dtype=int)
+    pairs = np.unique(np.column_stack([np.concatenate(left), np.concatenate(right)]), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def _given_agrees(a, b):
+    # same name, or one is a short form of the other (Jake/Jakob, Pat/Patrick)
+    same = a == b
+    prefix = np.array([isinstance(x, str) and isinstance(y, str) and len(x) >= 3 and len(y) >= 3
+                       and x[:3] == y[:3] for x, y in zip(a, b)], dtype=bool)
+    return same | prefix
+
+
+def score_pairs(keys, left, right, weights=WEIGHTS):
+    """Frame of candidate pairs with a 0/1 column per field and their total ``score``."""
+    fields = {'given_name': 'given_key', 'surname': 'surname_key', 'birthdate': 'birthdate_key',
+              'address': 'street_key', 'email': 'email_key', 'phone': 'phone_key', 'zip_code': 'zip_key'}
+    pairs = pd.DataFrame({'left': keys.index[left], 'right': keys.index[right]})
+    score = np.zeros(len(left), dtype='int16')
+    for field, column in fields.items():
+        a = keys[column].to_numpy()[left]
+        b = keys[column].to_numpy()[right]
+        if field == 'given_name':
+            agrees = _given_agrees(a, b)
+        else:
+            agrees = (a == b) & pd.notna(a)
+        pairs[field] = agrees
+        score += agrees * weights.get(field, 0)
+    pairs['score'] = score
+    return pairs
+
+
+class UnionFind:
+
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, i, j):
+        a, b = self.find(i), self.find(j)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+
+def placeholder_flags(keys):
+    """True for rows that are placeholder identities rather than patients."""
+    names = pd.Series(list(zip(keys['given_key'], keys['surname_key'])), index=keys.index)
+    blank = keys['given_key'].isna() & keys['surname_key'].isna()
+    # phones are compared on their last 10 digits, so a leading 1 doesn't matter
+    phones = keys['phone_key'].str[-10:]
+    return (blank | names.isin(PLACEHOLDER_NAMES) | keys['email_key'].isin(PLACEHOLDER_EMAILS)
+            | keys['street_key'].isin(PLACEHOLDER_ADDRESSES) | keys['zip_key'].isin(PLACEHOLDER_ZIPS)
+            | phones.isin(PLACEHOLDER_PHONES))
+
+
+def find_duplicates(patients, threshold=THRESHOLD, max_block=50):
+    """Cluster duplicate patient records.
+
+    Returns ``(clusters, pairs)``. ``clusters`` is indexed like ``patients``
+    with ``cluster`` (the position of the cluster's first row), ``survivor``
+    (the row to keep: the most complete record, then the longest given name,
+    then the first) and ``placeholder``. Placeholder rows are never
+    survivors. ``pairs`` holds every scored candidate pair and whether it
+    was taken as a match.
+    """
+    keys = record_keys(patients)
+    placeholder = placeholder_flags(keys)
+    left, right = candidate_pairs(keys, max_block=max_block)
+    pairs = score_pairs(keys, left, right)
+    pairs['match'] = pairs['score'] >= threshold
+
+    forest = UnionFind(len(patients))
+    for i, j in zip(left[pairs['match'].to_numpy()], right[pairs['match'].to_numpy()]):
+        forest.union(i, j)
+    cluster = np.array([forest.find(i) for i in range(len(patients))])
+
+    completeness = patients.notna().sum(axis=1).to_numpy()
+    given_length = keys['given_key'].str.len().fillna(0).to_numpy()
+    rank = pd.DataFrame({'cluster': cluster, 'placeholder': placeholder.to_numpy(),
+                         'completeness': -completeness, 'given_length': -given_length,
+                         'position': np.arange(len(patients))})
+    best = rank.sort_values(['cluster', 'placeholder', 'completeness', 'given_length', 'position'])
+    survivor = np.zeros(len(patients), dtype=bool)
+    survivor[best.drop_duplicates('cluster')['position'].to_numpy()] = True
+    survivor &= ~placeholder.to_numpy()
+
+    clusters = pd.DataFrame({'cluster': cluster, 'survivor': survivor, 'placeholder': placeholder.to_numpy()},
+                            index=patients.index)
+    return clusters, pairs
+
+
+def drop_duplicates(patients, clusters=None):
+    """``patients`` with only cluster survivors, placeholders removed."""
+    if clusters is None:
+        clusters, _ = find_duplicates(patients)
+    return patients[clusters['survivor'].to_numpy()]
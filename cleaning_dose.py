@@ -0,0 +1,75 @@
+"""Vectorized reshape of the treatments dose columns.
+
+The ``auralin`` and ``novodra`` columns hold ``41u - 48u`` for the drug a
+patient was on and ``-`` for the other one. ``split_dose`` in
+``cleaning-student.py`` turns that into treatment, start dose and end dose
+with a row-wise ``apply`` that builds a ``pd.Series`` per row. Here the same
+reshape is a couple of column-wide operations, with ``treatment`` as a
+categorical and the doses in the smallest unsigned integer type that fits.
+Strings are only parsed once per distinct value.
+
+Rows that don't hold exactly one well-formed dose are not an error; their
+index is returned so they can be looked at, and their new columns are NA.
+"""
+import numpy as np
+import pandas as pd
+
+DOSE_RE = r'^\s*(?P<start_dose>\d+)\s*u?\s*-\s*(?P<end_dose>\d+)\s*u?\s*$'
+TREATMENTS = ['auralin', 'novodra']
+
+
+def compact_uint(values):
+    """Numeric Series as the smallest nullable unsigned integer dtype that holds it."""
+    values = pd.to_numeric(values)
+    largest = values.max()
+    for dtype, limit in (('UInt8', 2 ** 8), ('UInt16', 2 ** 16), ('UInt32', 2 ** 32)):
+        if pd.isna(largest) or largest < limit:
+            return values.astype(dtype)
+    return values.astype('UInt64')
+
+
+def _parse_column(cells):
+    """(given, start, end) arrays for one dose column.
+
+    ``given`` is True where the cell holds anything but ``-``; start and end
+    are float arrays, NaN where the cell isn't a well-formed dose. Dose
+    strings repeat a lot, so only the distinct values are parsed and the
+    results are broadcast back through the factorize codes.
+    """
+    codes, uniques = pd.factorize(cells)
+    uniques = pd.Series(uniques, dtype='object')
+    parsed = uniques.str.extract(DOSE_RE).apply(pd.to_numeric).to_numpy(dtype='float64')
+    given = uniques.str.strip().ne('-').to_numpy(dtype=bool)
+    # an extra slot at the end for the -1 code of missing cells
+    parsed = np.vstack([parsed, [np.nan, np.nan]])
+    given = np.append(given, False)
+    return given[codes], parsed[codes, 0], parsed[codes, 1]
+
+
+def reshape_doses(treatments, columns=TREATMENTS):
+    """Replace the wide dose ``columns`` with treatment, start_dose and end_dose.
+
+    Returns ``(frame, malformed)``, where ``malformed`` is the index of rows
+    with no dose, more than one dose, or a dose that isn't ``<n>u - <n>u``.
+    """
+    n_given = np.zeros(len(treatments), dtype='int8')
+    codes = np.full(len(treatments), -1, dtype='int8')
+    start = np.full(len(treatments), np.nan)
+    end = np.full(len(treatments), np.nan)
+    for code, column in enumerate(columns):
+        given, column_start, column_end = _parse_column(treatments[column])
+        n_given += given
+        codes[given] = code
+        start = np.where(given, column_start, start)
+        end = np.where(given, column_end, end)
+
+    malformed = (n_given != 1) | np.isnan(start) | np.isnan(end)
+    codes[malformed] = -1
+    start[malformed] = np.nan
+    end[malformed] = np.nan
+
+    frame = treatments.drop(columns=list(columns))
+    frame['treatment'] = pd.Categorical.from_codes(codes, categories=list(columns))
+    frame['start_dose'] = compact_uint(pd.Series(start, index=frame.index))
+    frame['end_dose'] = compact_uint(pd.Series(end, index=frame.index))
+    return frame, treatments.index[malformed]
@@ -0,0 +1,104 @@
+"""Link treatments and adverse reactions to patients by name.
+
+``cleaning-student.py`` attaches the other tables by building a ``fullname``
+column (``given_name + " " + surname``) on each of them and merging on it.
+Two of the tables are lowercase and the names carry diacritics
+(``jindrová``, ``resanovič``, ``jožka``), so the merge only works after
+extra casing fixes and misses any spelling difference in the accents.
+
+``NameIndex`` keys patients on casefolded, NFKD-normalized given name and
+surname (the same ``name_key`` the duplicate detection uses) and ``link``
+looks each row of another table up in it, hash-join style, without adding
+columns to either table. Names with no exact key fall back to a trigram
+index over the patients' full names and take the best candidate scoring at
+least ``min_score`` (Dice coefficient of the trigram sets).
+"""
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from cleaning_dedupe import name_key
+
+MIN_SCORE = 0.7
+
+
+def full_key(given_names, surnames):
+    return name_key(given_names) + ' ' + name_key(surnames)
+
+
+def trigrams(key):
+    padded = '  {} '.format(key)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    """Exact and trigram indexes from patient name keys to ``patient_id``."""
+
+    def __init__(self, patients, id_column='patient_id'):
+        keys = full_key(patients['given_name'], patients['surname'])
+        ids = patients[id_column].to_numpy()
+        self.exact = {}
+        self.ambiguous = set()
+        for key, patient_id in zip(keys, ids):
+            if not isinstance(key, str):
+                continue
+            if key in self.exact and self.exact[key] != patient_id:
+                self.ambiguous.add(key)
+            self.exact.setdefault(key, patient_id)
+
+        self.keys = sorted(k for k in self.exact if k not in self.ambiguous)
+        self.grams = [trigrams(key) for key in self.keys]
+        self.postings = defaultdict(list)
+        for position, grams in enumerate(self.grams):
+            for gram in grams:
+                self.postings[gram].append(position)
+
+    def nearest(self, key):
+        """``(key, score)`` of the indexed name closest to ``key``, or ``(None, 0.0)``."""
+        grams = trigrams(key)
+        shared = defaultdict(int)
+        for gram in grams:
+            for position in self.postings.get(gram, ()):
+                shared[position] += 1
+        if not shared:
+            return None, 0.0
+        scores = {position: 2 * count / (len(grams) + len(self.grams[position]))
+                  for position, count in shared.items()}
+        best = max(scores, key=scores.get)
+        return self.keys[best], scores[best]
+
+    def link(self, table, min_score=MIN_SCORE):
+        """Frame indexed like ``table`` with ``patient_id``, ``link`` and ``score``.
+
+        ``link`` is ``exact``, ``ngram`` or ``ambiguous`` (a name shared by
+        several patients), and missing where nothing matched.
+        """
+        keys = full_key(table['given_name'], table['surname'])
+        patient_id = keys.map(self.exact)
+        link = pd.Series(np.where(patient_id.notna(), 'exact', None), index=table.index, dtype='object')
+        score = pd.Series(np.where(patient_id.notna(), 1.0, np.nan), index=table.index)
+
+        ambiguous = keys.isin(self.ambiguous)
+        patient_id[ambiguous] = np.nan
+        link[ambiguous] = 'ambiguous'
+        score[ambiguous] = np.nan
+
+        missed = patient_id.isna() & ~ambiguous & keys.notna()
+        # each distinct unmatched name is only looked up once
+        for key in keys[missed].unique():
+            match, best = self.nearest(key)
+            if match is not None and best >= min_score:
+                rows = missed & (keys == key)
+                patient_id[rows] = self.exact[match]
+                link[rows] = 'ngram'
+                score[rows] = best
+
+        return pd.DataFrame({'patient_id': patient_id.astype('UInt32'), 'link': link, 'score': score})
+
+
+def attach_patient_ids(table, patients, min_score=MIN_SCORE, index=None):
+    """``table`` with a ``patient_id`` column in place of the name merge."""
+    index = index or NameIndex(patients)
+    linked = index.link(table, min_score)
+    return table.assign(patient_id=linked['patient_id'])
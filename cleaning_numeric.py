@@ -0,0 +1,163 @@
+"""Read CSVs with damaged numeric columns straight into numeric dtypes.
+
+``data/animals.csv`` has a junk ``bb`` prefix on every animal name and
+``!`` where the decimal point should be (``1!35``), so ``read_csv`` leaves
+both weight columns as Python strings that then need fixing cell by cell.
+``read_repaired_csv`` takes a ``Repair`` per damaged column instead: a
+prefix to strip, the decimal mark used, a thousands separator (the RT
+rating counts look like ``32,323,000``) and the dtype wanted.
+
+With pyarrow the file is tokenized by Arrow's CSV reader with the repaired
+columns kept as Arrow strings, the repairs run as Arrow compute kernels and
+the columns are cast to their numeric type before they ever become pandas
+objects. Without pyarrow the same repairs run as pandas ``str`` methods on
+a ``string`` column. Values that still aren't numbers after the repairs
+become NA (or raise, with ``errors='raise'``).
+"""
+import collections
+import io
+import re
+
+import pandas as pd
+
+from cleaning_schema import HAS_PYARROW
+
+NUMBER_RE = r'^\s*[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?\s*$'
+INTEGER_RE = r'^\s*[+-]?\d+\s*$'
+NULLABLE_INTS = {'int8': 'Int8', 'int16': 'Int16', 'int32': 'Int32', 'int64': 'Int64',
+                 'uint8': 'UInt8', 'uint16': 'UInt16', 'uint32': 'UInt32', 'uint64': 'UInt64'}
+
+
+class Repair:
+
+    def __init__(self, prefix=None, decimal='.', thousands=None, dtype='float64'):
+        self.prefix = prefix
+        self.decimal = decimal
+        self.thousands = thousands
+        # 'string' for text columns that only need the prefix stripped
+        self.dtype = dtype
+
+    def __repr__(self):
+        return 'Repair(prefix={!r}, decimal={!r}, thousands={!r}, dtype={!r})'.format(
+            self.prefix, self.decimal, self.thousands, self.dtype)
+
+    @property
+    def numeric(self):
+        return self.dtype != 'string'
+
+
+ANIMALS = {
+    'Animal': Repair(prefix='bb', dtype='string'),
+    'Body weight (kg)': Repair(decimal='!'),
+    'Brain weight (g)': Repair(decimal='!'),
+}
+
+
+def _arrow_repair(array, repair, errors):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if repair.prefix:
+        array = pc.replace_substring_regex(array, '^' + re.escape(repair.prefix), '')
+    if not repair.numeric:
+        return array
+    if repair.thousands:
+        array = pc.replace_substring(array, repair.thousands, '')
+    if repair.decimal != '.':
+        array = pc.replace_substring(array, repair.decimal, '.')
+    # integers are cast directly so counts past 2**53 keep every digit
+    integer = repair.dtype in NULLABLE_INTS
+    valid = pc.match_substring_regex(array, INTEGER_RE if integer else NUMBER_RE)
+    if errors == 'raise' and not pc.all(pc.or_kleene(valid, pc.is_null(array))).as_py():
+        bad = pc.filter(array, pc.invert(valid))
+        raise ValueError('not a number after repair: {!r}'.format(bad[0].as_py()))
+    array = pc.if_else(valid, pc.utf8_trim_whitespace(array), pa.scalar(None, pa.string()))
+    return pc.cast(array, pa.int64() if integer else pa.float64())
+
+
+def _pandas_repair(values, repair, errors):
+    values = values.astype('string')
+    if repair.prefix:
+        values = values.str.replace('^' + re.escape(repair.prefix), '', regex=True)
+    if not repair.numeric:
+        return values
+    if repair.thousands:
+        values = values.str.replace(repair.thousands, '', regex=False)
+    if repair.decimal != '.':
+        values = values.str.replace(repair.decimal, '.', regex=False)
+    return pd.to_numeric(values.str.strip(), errors='raise' if errors == 'raise' else 'coerce')
+
+
+def _finish(values, repair):
+    if not repair.numeric:
+        return values.astype('string')
+    # integers come out nullable, since values that failed to parse are NA
+    return values.astype(NULLABLE_INTS.get(repair.dtype, repair.dtype))
+
+
+def _arrow_options(path, sep=',', encoding='utf-8', usecols=None, skiprows=None, **unsupported):
+    """Arrow CSV options for the ``read_csv`` keywords, or None if Arrow can't honour them."""
+    from pyarrow import csv
+
+    if unsupported or isinstance(path, io.TextIOBase) or len(sep) != 1:
+        return None
+    if skiprows is not None and not isinstance(skiprows, int):
+        return None
+    if usecols is not None and (callable(usecols) or not all(isinstance(c, str) for c in usecols)):
+        return None
+    return {'read_options': csv.ReadOptions(encoding=encoding, skip_rows=skiprows or 0),
+            'parse_options': csv.ParseOptions(delimiter=sep),
+            'include_columns': None if usecols is None else list(usecols)}
+
+
+def _with_repairs(dtype, repairs):
+    """A caller's ``dtype`` for read_csv with the repaired columns read as strings."""
+    if dtype is None:
+        merged = {}
+    elif isinstance(dtype, dict):
+        merged = dict(dtype)
+    else:
+        # one dtype for every other column
+        merged = collections.defaultdict(lambda: dtype)
+    merged.update({name: 'string' for name in repairs})
+    return merged
+
+
+def read_repaired_csv(path, repairs=ANIMALS, errors='coerce', **kwargs):
+    """Read ``path`` with each column in ``repairs`` repaired and typed.
+
+    Other columns are read as ``read_csv`` (or Arrow) would infer them.
+    Extra keyword arguments are ``pd.read_csv``'s. ``sep``, ``encoding``,
+    ``usecols`` (names) and ``skiprows`` (a count) are passed on to Arrow's
+    reader; any other keyword, or a text-mode file handle, makes it fall
+    back to ``pd.read_csv``. Repairs for columns that weren't read are
+    skipped.
+    """
+    options = _arrow_options(path, **kwargs) if HAS_PYARROW else None
+    if options is not None:
+        import pyarrow as pa
+        from pyarrow import csv
+
+        # blank cells are NA, as read_csv reads them, not ''
+        convert = csv.ConvertOptions(column_types={name: pa.string() for name in repairs},
+                                     include_columns=options['include_columns'], strings_can_be_null=True)
+        table = csv.read_csv(path, read_options=options['read_options'], parse_options=options['parse_options'],
+                             convert_options=convert)
+        repairs = {name: repair for name, repair in repairs.items() if name in table.column_names}
+        for name, repair in repairs.items():
+            i = table.schema.get_field_index(name)
+            table = table.set_column(i, name, _arrow_repair(table.column(name), repair, errors))
+        frame = table.to_pandas()
+        for name, repair in repairs.items():
+            if repair.dtype in NULLABLE_INTS:
+                # a plain to_pandas would go through float64 for columns with nulls
+                frame[name] = table.column(name).to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+    else:
+        frame = pd.read_csv(path, dtype=_with_repairs(kwargs.pop('dtype', None), repairs), **kwargs)
+        repairs = {name: repair for name, repair in repairs.items() if name in frame.columns}
+        for name, repair in repairs.items():
+            frame[name] = _pandas_repair(frame[name], repair, errors)
+
+    for name, repair in repairs.items():
+        frame[name] = _finish(frame[name], repair)
+    return frame
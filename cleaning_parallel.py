@@ -0,0 +1,164 @@
+"""Multi-core execution of the row-local cleaning rules.
+
+``run_partitioned`` splits a table into partitions, either one per value of
+a column such as ``state`` or by a hash of a key such as ``patient_id``,
+and runs the row-local rules of a pipeline on each partition in a process
+pool. Partitions don't travel through pickle: each one is written as an
+Arrow IPC stream into a shared memory block, and the worker writes its
+result back the same way, so only block names go through the pool's pipes.
+The results are put back in the original row order (minus any rows a
+filter rule dropped) with the original index.
+
+Rules are closures, so the pool is given the pipeline's factory function
+(``patients_pipeline``) and every worker builds its own copy. Rules that
+aren't row-local run afterwards, in this process, on the reassembled
+table. Needs pyarrow.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from cleaning_pipeline import patients_pipeline
+from cleaning_stream import bucket_of
+
+_worker_rules = None
+
+
+def to_shared(frame):
+    """Write ``frame`` to a new shared memory block; returns ``(name, size)``."""
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(frame, preserve_index=True)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    buffer = sink.getvalue()
+    size = buffer.size
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    block.buf[:size] = memoryview(buffer).cast('B')
+    block.close()
+    return block.name, size
+
+
+def from_shared(name, size, unlink=True):
+    """Read a frame written by ``to_shared``, freeing the block unless told not to.
+
+    Arrow reads the stream in place, so columns Arrow can hand over as-is
+    (Arrow-backed strings) still live in the block; it is unmapped when
+    the last of them is freed. The name is unlinked right away.
+    """
+    import ctypes
+
+    import pyarrow as pa
+
+    block = shared_memory.SharedMemory(name=name)
+    if unlink:
+        # the mapping stays valid until the block is closed
+        block.unlink()
+    pointer = ctypes.c_char.from_buffer(block.buf)
+    address = ctypes.addressof(pointer)
+    del pointer
+    # the buffer holds on to ``block``, which closes itself when collected
+    buffer = pa.foreign_buffer(address, size, base=block)
+    return pa.ipc.open_stream(buffer).read_all().to_pandas()
+
+
+def _unlink(name):
+    try:
+        shared_memory.SharedMemory(name=name).unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _concat(parts):
+    """Concatenate partition results, keeping categoricals whose categories differ between them."""
+    # an empty partition loses its categories on the way through Arrow
+    parts = [part for part in parts if len(part)] or parts[:1]
+    cleaned = pd.concat(parts)
+    for name in cleaned.columns:
+        columns = [part[name] for part in parts]
+        if all(isinstance(column.dtype, pd.CategoricalDtype) for column in columns) \
+                and not isinstance(cleaned[name].dtype, pd.CategoricalDtype):
+            values = union_categoricals(columns)
+            cleaned[name] = pd.Categorical.from_codes(values.codes, dtype=values.dtype)
+    return cleaned
+
+
+def _init_worker(pipeline_factory):
+    global _worker_rules
+    pipeline = pipeline_factory()
+    _worker_rules = [rule for rule in pipeline.order() if rule.row_local]
+
+
+def _clean_partition(partition, name, size):
+    start = time.perf_counter()
+    frame = from_shared(name, size)
+    from cleaning_pipeline import Pipeline
+    cleaned, _ = Pipeline().run(frame, rules=_worker_rules)
+    out_name, out_size = to_shared(cleaned)
+    return {'partition': partition, 'name': out_name, 'size': out_size, 'rows_in': len(frame),
+            'rows_out': len(cleaned), 'seconds': time.perf_counter() - start, 'pid': os.getpid()}
+
+
+def partition_codes(frame, by, buckets=None):
+    """Partition number of each row: a hash bucket of ``by`` if ``buckets`` is given, else one per value."""
+    if buckets:
+        columns = [by] if isinstance(by, str) else list(by)
+        return bucket_of(frame[columns].astype('object').astype(str), buckets).to_numpy()
+    codes, _ = pd.factorize(frame[by], use_na_sentinel=False)
+    return codes
+
+
+def split_rules(pipeline):
+    """``(row_local, rest)`` rules in run order; the row-local ones can't depend on the rest."""
+    ordered = pipeline.order()
+    local = [rule for rule in ordered if rule.row_local]
+    rest = [rule for rule in ordered if not rule.row_local]
+    for i, rule in enumerate(ordered):
+        if rule.row_local and any(rule.depends_on(other) for other in ordered[:i] if not other.row_local):
+            raise ValueError('row-local rule {} depends on a rule that is not row-local'.format(rule.name))
+    return local, rest
+
+
+def run_partitioned(frame, pipeline_factory=patients_pipeline, by='state', buckets=None, processes=None):
+    """Clean ``frame`` with the rules from ``pipeline_factory()`` on all cores.
+
+    Returns ``(cleaned, report)``; the report has one row per partition with
+    its row counts, time and worker pid.
+    """
+    pipeline = pipeline_factory()
+    _, rest = split_rules(pipeline)
+
+    # partitions are addressed by position so labels can be restored at the end
+    positioned = frame.set_axis(pd.RangeIndex(len(frame)), axis=0)
+    codes = partition_codes(positioned, by, buckets)
+
+    blocks = []
+    for partition in np.unique(codes):
+        blocks.append((int(partition),) + to_shared(positioned[codes == partition]))
+
+    futures = []
+    try:
+        with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(pipeline_factory,)) as pool:
+            futures = [pool.submit(_clean_partition, *block) for block in blocks]
+            results = [future.result() for future in futures]
+        parts = [from_shared(result['name'], result['size']) for result in results]
+    finally:
+        # after an error, inputs a worker never got to and the outputs of
+        # partitions that did finish are still allocated
+        finished = [future.result()['name'] for future in futures
+                    if future.done() and not future.cancelled() and future.exception() is None]
+        for name in [name for _, name, _ in blocks] + finished:
+            _unlink(name)
+
+    cleaned = _concat(parts).sort_index(kind='stable')
+    cleaned.index = frame.index[cleaned.index.to_numpy()]
+    if rest:
+        cleaned, _ = pipeline.run(cleaned, rules=rest)
+    report = pd.DataFrame(results).drop(columns=['name', 'size'])
+    return cleaned, report
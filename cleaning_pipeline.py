@@ -0,0 +1,224 @@
+"""Declarative cleaning pipeline for the study tables.
+
+Each Define/Code/Test block of ``cleaning-student.py`` becomes a ``Rule``:
+a function plus the columns it reads and the columns it writes (or drops).
+A rule gets a frame holding just its input columns and returns its output
+columns, or, for a row filter, a boolean mask. ``Pipeline.run`` orders the
+rules as a DAG over those column dependencies and keeps the working table
+as a dict of column Series, so a rule only ever allocates the columns it
+changes; nothing else is copied between stages. The report from a run
+gives the time, row counts and peak traced memory of every stage, and a
+``gathering_trace.Tracer`` passed as ``tracer`` gets a record per stage too.
+
+``patients_pipeline()`` and ``treatments_pipeline()`` hold the rules used
+by the notebook.
+"""
+import contextlib
+import time
+import tracemalloc
+
+import pandas as pd
+
+from cleaning_reference import normalize_countries, normalize_states
+from cleaning_schema import BIRTHDATE_FORMAT, pad_zip
+
+
+class Rule:
+
+    def __init__(self, name, func, inputs, outputs=(), drops=(), filters_rows=False, row_local=True):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.drops = list(drops)
+        self.filters_rows = filters_rows
+        # True if each row's result depends on that row alone, so the rule can
+        # run on any slice of the table
+        self.row_local = row_local
+
+    def __repr__(self):
+        return 'Rule({!r}, inputs={}, outputs={})'.format(self.name, self.inputs, self.outputs)
+
+    def depends_on(self, other):
+        """True if this rule has to run after ``other`` (which was registered before it)."""
+        writes = set(other.outputs) | set(other.drops)
+        mine = set(self.outputs) | set(self.drops)
+        if writes & set(self.inputs) or writes & mine or set(other.inputs) & mine:
+            return True
+        # Row filters commute with row-local rules; anything that looks across
+        # rows has to see exactly the rows it saw in the notebook
+        if self.filters_rows or other.filters_rows:
+            return not (self.row_local and other.row_local)
+        return False
+
+
+class Pipeline:
+
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+
+    def add(self, rule):
+        if any(r.name == rule.name for r in self.rules):
+            raise ValueError('duplicate rule name: ' + rule.name)
+        self.rules.append(rule)
+        return rule
+
+    def rule(self, inputs, outputs=(), drops=(), filters_rows=False, row_local=True, name=None):
+        """Decorator registering a function as a rule."""
+        def register(func):
+            self.add(Rule(name or func.__name__, func, inputs, outputs, drops, filters_rows, row_local))
+            return func
+        return register
+
+    def order(self, targets=None):
+        """Rules in dependency order, limited to what ``targets`` columns need if given."""
+        deps = {rule.name: [other.name for other in self.rules[:i] if rule.depends_on(other)]
+                for i, rule in enumerate(self.rules)}
+        by_name = {rule.name: rule for rule in self.rules}
+        if targets is None:
+            needed = set(by_name)
+        else:
+            needed = set()
+            stack = [r.name for r in self.rules if set(r.outputs) & set(targets) or r.filters_rows]
+            while stack:
+                name = stack.pop()
+                if name not in needed:
+                    needed.add(name)
+                    stack.extend(deps[name])
+
+        ordered = []
+        done = set()
+        pending = [r.name for r in self.rules if r.name in needed]
+        while pending:
+            ready = [name for name in pending if all(d in done or d not in needed for d in deps[name])]
+            if not ready:
+                raise ValueError('rule dependencies form a cycle: ' + ', '.join(pending))
+            for name in ready:
+                ordered.append(by_name[name])
+                done.add(name)
+            pending = [name for name in pending if name not in done]
+        return ordered
+
+    def run(self, frame, targets=None, measure_memory=False, rules=None, tracer=None):
+        """Run the rules on ``frame`` and return ``(cleaned, report)``.
+
+        ``frame`` itself is never modified. ``measure_memory`` turns on
+        tracemalloc for the run so the report includes each stage's peak
+        allocation; it slows the run down, so it's off by default.
+        ``rules`` runs exactly those rules (in the given order) instead of
+        ``self.order(targets)``. With a ``tracer`` the run and each rule
+        are also written to its trace, with CPU time and peak RSS.
+        """
+        columns = {name: frame[name] for name in frame.columns}
+        index = frame.index
+        report = []
+        tracing = measure_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        run = tracer.span('pipeline', rows_in=len(index)) if tracer is not None else contextlib.nullcontext()
+        try:
+            with run:
+                for rule in (rules if rules is not None else self.order(targets)):
+                    rows_in = len(index)
+                    if measure_memory:
+                        tracemalloc.reset_peak()
+                        before = tracemalloc.get_traced_memory()[0]
+                    start = time.perf_counter()
+                    span = (tracer.span(rule.name, kind='rule', rows_in=rows_in) if tracer is not None
+                            else contextlib.nullcontext())
+
+                    with span:
+                        view = pd.DataFrame({name: columns[name] for name in rule.inputs}, index=index, copy=False)
+                        result = rule.func(view)
+                        if rule.filters_rows:
+                            mask = pd.Series(result, index=index).fillna(False).astype(bool).to_numpy()
+                            index = index[mask]
+                            columns = {name: column[mask] for name, column in columns.items()}
+                        else:
+                            if isinstance(result, pd.Series):
+                                result = result.to_frame(rule.outputs[0])
+                            for name in rule.outputs:
+                                columns[name] = result[name]
+                        for name in rule.drops:
+                            columns.pop(name, None)
+                        if tracer is not None:
+                            span.rows_out = len(index)
+
+                    entry = {'rule': rule.name,
+                             'seconds': time.perf_counter() - start,
+                             'rows_in': rows_in,
+                             'rows_out': len(index),
+                             'columns_written': len(rule.outputs)}
+                    if measure_memory:
+                        entry['peak_bytes'] = tracemalloc.get_traced_memory()[1] - before
+                    report.append(entry)
+                if tracer is not None:
+                    run.rows_out = len(index)
+        finally:
+            if tracing:
+                tracemalloc.stop()
+
+        cleaned = pd.DataFrame(columns, index=index, copy=False)
+        return cleaned, pd.DataFrame(report)
+
+
+# -- Rules from cleaning-student.py ------------------------------------------
+
+def patients_pipeline():
+    from cleaning_contact import split_contact
+
+    pipeline = Pipeline()
+
+    @pipeline.rule(['contact'], filters_rows=True)
+    def drop_missing_contact(df):
+        return df['contact'].notna()
+
+    @pipeline.rule(['contact'], ['phone', 'email'], drops=['contact'])
+    def split_contact_column(df):
+        return split_contact(df['contact'])
+
+    @pipeline.rule(['zip_code'], ['zip_code'])
+    def zip_code_as_string(df):
+        return pad_zip(df['zip_code'])
+
+    @pipeline.rule(['state'], ['state'])
+    def abbreviate_state(df):
+        return normalize_states(df['state'])
+
+    @pipeline.rule(['country'], ['country'])
+    def normalize_country(df):
+        return normalize_countries(df['country'])
+
+    @pipeline.rule(['birthdate'], ['birthdate'])
+    def parse_birthdate(df):
+        # already done if the table came from cleaning_schema.load_table
+        if pd.api.types.is_datetime64_any_dtype(df['birthdate']):
+            return df['birthdate']
+        return pd.to_datetime(df['birthdate'], format=BIRTHDATE_FORMAT)
+
+    @pipeline.rule(['given_name', 'surname'], filters_rows=True)
+    def drop_john_doe(df):
+        return ~((df['given_name'] == 'John') & (df['surname'] == 'Doe'))
+
+    return pipeline
+
+
+def treatments_pipeline():
+    from cleaning_dose import reshape_doses
+
+    pipeline = Pipeline()
+
+    @pipeline.rule(['hba1c_start', 'hba1c_end'], ['hba1c_change'])
+    def recompute_hba1c_change(df):
+        return df['hba1c_start'] - df['hba1c_end']
+
+    @pipeline.rule(['auralin', 'novodra'], ['treatment', 'start_dose', 'end_dose'], drops=['auralin', 'novodra'])
+    def split_doses(df):
+        return reshape_doses(df)[0]
+
+    @pipeline.rule(['given_name', 'surname'], ['given_name', 'surname'])
+    def capitalize_names(df):
+        return pd.DataFrame({'given_name': df['given_name'].str.capitalize(),
+                             'surname': df['surname'].str.capitalize()})
+
+    return pipeline
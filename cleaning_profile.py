@@ -0,0 +1,294 @@
+"""One-pass profile of a table, for the Assess step.
+
+The Assess cells of ``cleaning-student.py`` call ``info()``, ``describe()``,
+``value_counts()``, ``duplicated()``, ``isnull()`` and ``sample()`` one
+after another, each a full scan of the table. ``profile_csv`` reads the
+file once, in chunks, and keeps a fixed-size summary per column:
+
+- row and null counts, and how many values don't conform to the declared
+  type of the column (from cleaning_schema, or a pattern in ``PATTERNS``),
+  with a few examples;
+- min, max and quantiles of numeric and date columns, the quantiles from a
+  uniform reservoir sample (exact when the column fits in the reservoir);
+- the most frequent values, counted with a count-min sketch;
+- the number of distinct values, estimated with HyperLogLog.
+
+Duplicate rows are counted exactly from a set of 64-bit row hashes while
+the distinct rows number at most ``exact_rows``. Past that the set is
+dropped and the count comes from a HyperLogLog of the rows, reported with
+its standard error (about 0.8% of the distinct rows, easily more than the
+duplicates in a clean extract, so treat it as an order of magnitude).
+Apart from that set, memory doesn't grow with the file, so this works on
+extracts bigger than RAM. The report is a plain dict; ``write_report`` saves it as
+JSON.
+"""
+import heapq
+import json
+
+import numpy as np
+import pandas as pd
+
+from cleaning_schema import BIRTHDATE_FORMAT, SCHEMAS
+
+PATTERNS = {'zip_code': r'^\d{5}$'}
+DATE_FORMATS = {'birthdate': BIRTHDATE_FORMAT}
+# Distinct rows counted exactly before falling back to HyperLogLog; a set
+# of this many hashes takes roughly 100 MB
+EXACT_ROWS = 2 * 10 ** 6
+
+
+def hash_values(values, seed=0):
+    """64-bit hashes of a Series' values; NaN values hash too, so drop them first."""
+    key = '{:016d}'.format(seed)
+    return pd.util.hash_array(values.astype('object').astype(str).to_numpy(), hash_key=key)
+
+
+class HyperLogLog:
+    """Distinct-count estimate in ``2 ** precision`` one-byte registers."""
+
+    def __init__(self, precision=14):
+        self.p = precision
+        self.registers = np.zeros(2 ** precision, dtype='uint8')
+
+    def add_hashes(self, hashes):
+        if not len(hashes):
+            return
+        low_bits = 64 - self.p
+        buckets = (hashes >> np.uint64(low_bits)).astype('int64')
+        rest = hashes & np.uint64((1 << low_bits) - 1)
+        # position of the leftmost 1 in the low bits; exact in float64 since low_bits <= 53
+        bit_length = np.frexp(rest.astype('float64'))[1]
+        rank = (low_bits - bit_length + 1).astype('uint8')
+        np.maximum.at(self.registers, buckets, rank)
+
+    def std_error(self):
+        """Relative standard error of ``estimate``."""
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(2.0 ** -self.registers.astype('float64'))
+        empty = np.count_nonzero(self.registers == 0)
+        if raw <= 2.5 * m and empty:
+            return float(m * np.log(m / empty))
+        return float(raw)
+
+
+class CountMin:
+    """Count-min sketch plus a bounded set of heavy-hitter candidates."""
+
+    def __init__(self, width=4096, depth=4, candidates=64):
+        self.table = np.zeros((depth, width), dtype='int64')
+        self.candidates = {}
+        self.capacity = candidates
+
+    def _columns(self, values):
+        return [hash_values(values, seed) % np.uint64(self.table.shape[1]) for seed in range(self.table.shape[0])]
+
+    def add(self, values):
+        counts = values.value_counts(sort=False)
+        if not len(counts):
+            return
+        keys = counts.index.to_series()
+        columns = self._columns(keys)
+        for row, column in enumerate(columns):
+            np.add.at(self.table[row], column.astype('int64'), counts.to_numpy())
+        estimates = np.min([self.table[row, column.astype('int64')] for row, column in enumerate(columns)], axis=0)
+        for value, estimate in zip(keys, estimates):
+            self.candidates[value] = int(estimate)
+        if len(self.candidates) > self.capacity:
+            self.candidates = dict(heapq.nlargest(self.capacity, self.candidates.items(), key=lambda kv: kv[1]))
+
+    def top(self, k):
+        return heapq.nlargest(k, self.candidates.items(), key=lambda kv: kv[1])
+
+
+class Reservoir:
+    """Uniform sample of at most ``size`` values seen so far."""
+
+    def __init__(self, size=10000, seed=0):
+        self.size = size
+        self.seen = 0
+        self.values = np.array([], dtype='float64')
+        self.rng = np.random.default_rng(seed)
+
+    def add(self, values):
+        values = np.asarray(values, dtype='float64')
+        room = self.size - len(self.values)
+        if room > 0:
+            self.values = np.concatenate([self.values, values[:room]])
+            self.seen += min(room, len(values))
+            values = values[room:]
+        if len(values):
+            # Algorithm R, one chunk at a time
+            positions = self.seen + np.arange(1, len(values) + 1)
+            slots = (self.rng.random(len(values)) * positions).astype('int64')
+            keep = slots < self.size
+            self.values[slots[keep]] = values[keep]
+            self.seen += len(values)
+
+    def quantiles(self, qs):
+        if not len(self.values):
+            return {str(q): None for q in qs}
+        return {str(q): float(v) for q, v in zip(qs, np.quantile(self.values, qs))}
+
+
+def column_kind(name, dtype):
+    if name in DATE_FORMATS:
+        return 'date'
+    if name in PATTERNS:
+        return 'pattern'
+    dtype = str(dtype)
+    if dtype.startswith(('UInt', 'Int', 'int', 'uint')):
+        return 'integer'
+    if dtype.startswith('float'):
+        return 'float'
+    return 'text'
+
+
+class ColumnProfile:
+
+    def __init__(self, name, kind, top_k=10, examples=5):
+        self.name = name
+        self.kind = kind
+        self.top_k = top_k
+        self.examples = examples
+        self.count = 0
+        self.nulls = 0
+        self.nonconforming = 0
+        self.bad_examples = []
+        self.minimum = None
+        self.maximum = None
+        self.distinct = HyperLogLog()
+        self.frequent = CountMin()
+        self.sample = Reservoir()
+
+    def _numbers(self, values):
+        """Numeric view of the values and a mask of the ones that don't conform."""
+        if self.kind == 'date':
+            parsed = pd.to_datetime(values, format=DATE_FORMATS[self.name], errors='coerce')
+            return (parsed - pd.Timestamp(0)).dt.total_seconds(), parsed.isna()
+        if self.kind == 'pattern':
+            return None, ~values.str.match(PATTERNS[self.name])
+        if self.kind in ('integer', 'float'):
+            numbers = pd.to_numeric(values, errors='coerce')
+            bad = numbers.isna()
+            if self.kind == 'integer':
+                bad |= numbers.notna() & (numbers % 1 != 0)
+            return numbers.where(~bad), bad
+        return None, pd.Series(False, index=values.index)
+
+    def add(self, values):
+        self.count += len(values)
+        present = values.dropna()
+        self.nulls += len(values) - len(present)
+        if not len(present):
+            return
+        numbers, bad = self._numbers(present)
+        self.nonconforming += int(bad.sum())
+        room = self.examples - len(self.bad_examples)
+        if room > 0 and bad.any():
+            self.bad_examples.extend(present[bad].unique()[:room].tolist())
+        if numbers is not None:
+            numbers = numbers.dropna()
+            if len(numbers):
+                low, high = float(numbers.min()), float(numbers.max())
+                self.minimum = low if self.minimum is None else min(self.minimum, low)
+                self.maximum = high if self.maximum is None else max(self.maximum, high)
+                self.sample.add(numbers.to_numpy())
+        self.distinct.add_hashes(hash_values(present))
+        self.frequent.add(present)
+
+    def report(self, quantiles):
+        result = {'kind': self.kind,
+                  'count': self.count,
+                  'nulls': self.nulls,
+                  'nonconforming': self.nonconforming,
+                  'nonconforming_examples': self.bad_examples,
+                  'distinct_estimate': round(self.distinct.estimate()),
+                  'top': [{'value': value, 'count': count} for value, count in self.frequent.top(self.top_k)]}
+        if self.minimum is not None:
+            scale = self._from_number
+            result.update({'min': scale(self.minimum), 'max': scale(self.maximum),
+                           'quantiles': {q: scale(v) for q, v in self.sample.quantiles(quantiles).items()},
+                           'quantiles_exact': self.sample.seen <= self.sample.size})
+        return result
+
+    def _from_number(self, value):
+        if value is None or self.kind != 'date':
+            return value
+        return pd.Timestamp(value, unit='s').strftime('%Y-%m-%d')
+
+
+def _profiles(columns, table, top_k):
+    schema = SCHEMAS.get(table, {})
+    return {name: ColumnProfile(name, column_kind(name, schema.get(name, 'object')), top_k) for name in columns}
+
+
+def _profile_chunks(chunks, table, top_k, quantiles, exact_rows):
+    profiles = None
+    rows = HyperLogLog()
+    seen = set()
+    n_rows = 0
+    for chunk in chunks:
+        if profiles is None:
+            profiles = _profiles(chunk.columns, table, top_k)
+        n_rows += len(chunk)
+        hashes = pd.util.hash_pandas_object(chunk.astype('object'), index=False).to_numpy()
+        rows.add_hashes(hashes)
+        if seen is not None:
+            seen.update(hashes.tolist())
+            if len(seen) > exact_rows:
+                seen = None
+        for name, profile in profiles.items():
+            profile.add(chunk[name])
+    if seen is not None:
+        distinct_rows, error = len(seen), 0
+    else:
+        estimate = rows.estimate()
+        distinct_rows, error = min(round(estimate), n_rows), round(estimate * rows.std_error())
+    return {'table': table,
+            'rows': n_rows,
+            'distinct_rows': distinct_rows,
+            'duplicate_rows': n_rows - distinct_rows,
+            # 0 when counted exactly, else the HyperLogLog standard error
+            'duplicate_rows_std_error': error,
+            'columns': {name: profile.report(quantiles) for name, profile in (profiles or {}).items()}}
+
+
+def profile_csv(path, table=None, chunksize=100000, top_k=10, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95),
+                exact_rows=EXACT_ROWS):
+    """Profile a CSV in one chunked pass; ``table`` picks the schema to check types against."""
+    chunks = pd.read_csv(path, dtype=str, chunksize=chunksize)
+    return _profile_chunks(chunks, table, top_k, quantiles, exact_rows)
+
+
+def profile_frame(frame, table=None, top_k=10, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95), exact_rows=EXACT_ROWS):
+    """Same report for a frame already read without dtypes, as plain ``read_csv`` gives it.
+
+    Whole floats are profiled as ``92390`` rather than ``92390.0``, so the
+    patterns match as they do for ``profile_csv``. The frame no longer has
+    the text of each cell, though: a file that writes ``30.0`` gets ``30``
+    here, which can change the top values and the distinct estimate.
+    """
+    return _profile_chunks([_as_text(frame)], table, top_k, quantiles, exact_rows)
+
+
+def _as_text(frame):
+    # the cells as read_csv(dtype=str) reads them: read_csv makes floats of
+    # whole numbers (zips with missing values, weights like 180), and
+    # str(92390.0) would fail the zip pattern
+    columns = {}
+    for name, values in frame.items():
+        text = values.astype(str)
+        if pd.api.types.is_float_dtype(values):
+            whole = (values % 1 == 0) & (values.abs() < 2 ** 63)
+            text[whole] = values[whole].astype('int64').astype(str)
+        columns[name] = text.where(values.notna())
+    return pd.DataFrame(columns, index=frame.index)
+
+
+def write_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
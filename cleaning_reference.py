@@ -0,0 +1,123 @@
+"""Reference data for normalizing ``state``, ``country`` and zip codes.
+
+``replace_name`` in ``cleaning-student.py`` maps five full state names to
+their abbreviations through a row-wise ``apply`` and lets every other name
+through unchanged. The tables under ``data/reference`` cover all US states,
+DC, territories and military codes (``us_states.csv``), ISO 3166 countries
+plus common aliases (``countries.csv``, ``country_aliases.csv``) and the
+state each 3-digit zip prefix belongs to (``zip3_states.csv``).
+
+``normalize_states`` and ``normalize_countries`` look up each distinct
+value once and return a categorical over the full set of codes or names,
+so every chunk or extract gets the same categories; values that aren't in
+the tables become missing. ``zip_states`` and ``zip_state_mismatches``
+check zips against the state they are recorded with.
+"""
+import functools
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from cleaning_schema import pad_zip
+
+REFERENCE_DIR = 'data/reference'
+
+
+def _read(name):
+    # keep_default_na: "NA" is Namibia
+    return pd.read_csv('{}/{}'.format(REFERENCE_DIR, name), dtype=str, keep_default_na=False)
+
+
+def lookup_key(value):
+    """Casefolded, accent-free, punctuation-free form used to look values up."""
+    value = unicodedata.normalize('NFKD', str(value))
+    value = ''.join(c for c in value if not unicodedata.combining(c)).casefold()
+    return ' '.join(re.sub(r'[^\w\s]', '', value).split())
+
+
+@functools.lru_cache()
+def states():
+    return _read('us_states.csv')
+
+
+@functools.lru_cache()
+def countries():
+    return _read('countries.csv')
+
+
+@functools.lru_cache()
+def zip3_ranges():
+    return _read('zip3_states.csv')
+
+
+@functools.lru_cache()
+def _state_lookup():
+    table = states()
+    lookup = {lookup_key(code): code for code in table['code']}
+    lookup.update({lookup_key(name): code for name, code in zip(table['name'], table['code'])})
+    lookup.update({'washington dc': 'DC', 'dc': 'DC'})
+    return lookup
+
+
+@functools.lru_cache()
+def _country_lookup():
+    table = countries()
+    names = dict(zip(table['code'], table['name']))
+    lookup = {lookup_key(code): name for code, name in names.items()}
+    lookup.update({lookup_key(name): name for name in names.values()})
+    aliases = _read('country_aliases.csv')
+    lookup.update({lookup_key(alias): names[code] for alias, code in zip(aliases['alias'], aliases['code'])})
+    return lookup
+
+
+def _categorize(values, lookup, categories):
+    """Map each distinct value through ``lookup`` once and broadcast the result as a categorical."""
+    codes, uniques = pd.factorize(values.astype('object'))
+    positions = {category: i for i, category in enumerate(categories)}
+    mapped = np.array([positions.get(lookup.get(lookup_key(value)), -1) for value in uniques] + [-1], dtype='int16')
+    # code -1 (missing) picks the trailing -1
+    return pd.Series(pd.Categorical.from_codes(mapped[codes], categories=categories), index=values.index,
+                     name=values.name)
+
+
+def normalize_states(values):
+    """Two-letter USPS codes for state names or codes, as a categorical of all codes."""
+    return _categorize(values, _state_lookup(), list(states()['code']))
+
+
+def normalize_countries(values):
+    """Canonical country names for names, ISO codes or aliases, as a categorical of all countries."""
+    return _categorize(values, _country_lookup(), list(countries()['name']))
+
+
+def unmapped(values, normalized):
+    """Distinct non-missing values that a normalize_* function couldn't map."""
+    return pd.unique(values[values.notna() & normalized.isna()].astype('object'))
+
+
+@functools.lru_cache()
+def _zip3_table():
+    """Array of 1000 state codes (positions into ``states()``), -1 for unused prefixes."""
+    codes = {code: i for i, code in enumerate(states()['code'])}
+    table = np.full(1000, -1, dtype='int16')
+    for low, high, state in zip3_ranges().itertuples(index=False):
+        table[int(low):int(high) + 1] = codes[state]
+    return table
+
+
+def zip_states(zip_codes):
+    """State each zip code belongs to by its 3-digit prefix, as a categorical of all codes."""
+    prefix = pd.to_numeric(pad_zip(zip_codes).str[:3], errors='coerce')
+    valid = prefix.notna().to_numpy()
+    codes = np.full(len(zip_codes), -1, dtype='int16')
+    codes[valid] = _zip3_table()[prefix[valid].astype('int64').to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, categories=list(states()['code'])), index=zip_codes.index)
+
+
+def zip_state_mismatches(frame, zip_column='zip_code', state_column='state'):
+    """True where a row's zip prefix belongs to a different state than the one recorded."""
+    expected = zip_states(frame[zip_column]).astype('object')
+    recorded = normalize_states(frame[state_column]).astype('object')
+    return (expected.notna() & recorded.notna() & (expected != recorded)).astype(bool)
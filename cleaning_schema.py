@@ -0,0 +1,99 @@
+"""Declared dtypes for the study tables in ``data/``.
+
+``pd.read_csv`` with no dtypes turns ``zip_code`` into float64 (losing the
+leading zero of 4-digit zips), leaves ``birthdate`` as text and stores every
+low-cardinality column as Python strings. The schemas below fix that at load
+time: categoricals for columns like ``state`` and ``assigned_sex``, nullable
+small ints, zips as zero-padded strings and birthdates parsed with their one
+known format. That makes the notebook's zip and birthdate cleaning steps
+unnecessary.
+
+``load_table`` uses the pyarrow CSV engine when pyarrow is installed and
+the C engine otherwise. ``memory_report`` compares the result against a
+plain ``read_csv``.
+"""
+import importlib.util
+
+import pandas as pd
+
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+STRING = 'string[pyarrow]' if HAS_PYARROW else 'string'
+
+BIRTHDATE_FORMAT = '%m/%d/%Y'
+
+SCHEMAS = {
+    'patients': {
+        'patient_id': 'UInt32',
+        'assigned_sex': 'category',
+        'given_name': STRING,
+        'surname': STRING,
+        'address': STRING,
+        'city': STRING,
+        'state': 'category',
+        'zip_code': STRING,
+        'country': 'category',
+        'contact': STRING,
+        'birthdate': STRING,
+        'weight': 'float64',
+        'height': 'UInt8',
+        'bmi': 'float64',
+    },
+    'treatments': {
+        'given_name': STRING,
+        'surname': STRING,
+        'auralin': 'category',
+        'novodra': 'category',
+        'hba1c_start': 'float64',
+        'hba1c_end': 'float64',
+        'hba1c_change': 'float64',
+    },
+    'adverse_reactions': {
+        'given_name': STRING,
+        'surname': STRING,
+        'adverse_reaction': 'category',
+    },
+}
+SCHEMAS['treatments_cut'] = SCHEMAS['treatments']
+
+
+def csv_engine():
+    return 'pyarrow' if HAS_PYARROW else 'c'
+
+
+def pad_zip(zip_code):
+    """Zip codes as 5-character strings, whether they were read as floats or strings."""
+    if pd.api.types.is_numeric_dtype(zip_code):
+        zip_code = zip_code.astype('Int64').astype('string')
+    return zip_code.str.zfill(5)
+
+
+def apply_schema(frame, table):
+    """Finish the columns read_csv can't type on its own: zip padding and birthdates."""
+    if table == 'patients':
+        if 'zip_code' in frame:
+            frame['zip_code'] = pad_zip(frame['zip_code'])
+        if 'birthdate' in frame:
+            frame['birthdate'] = pd.to_datetime(frame['birthdate'], format=BIRTHDATE_FORMAT)
+    return frame
+
+
+def load_table(table, path=None, engine=None, **kwargs):
+    """Read one of the study tables with its declared dtypes."""
+    path = path or 'data/{}.csv'.format(table)
+    frame = pd.read_csv(path, dtype=SCHEMAS[table], engine=engine or csv_engine(), **kwargs)
+    return apply_schema(frame, table)
+
+
+def memory_report(tables=('patients', 'treatments', 'adverse_reactions'), data_dir='data'):
+    """Deep memory use of each table loaded with inferred types vs. with its schema."""
+    rows = []
+    for table in tables:
+        path = '{}/{}.csv'.format(data_dir, table)
+        inferred = pd.read_csv(path).memory_usage(deep=True).sum()
+        declared = load_table(table, path).memory_usage(deep=True).sum()
+        rows.append({'table': table,
+                     'inferred_bytes': inferred,
+                     'schema_bytes': declared,
+                     'saved_bytes': inferred - declared,
+                     'ratio': inferred / declared})
+    return pd.DataFrame(rows)
@@ -0,0 +1,162 @@
+"""Constant-memory cleaning of study extracts that don't fit in RAM.
+
+``clean_in_chunks`` reads a CSV ``chunksize`` rows at a time with the
+declared dtypes from cleaning_schema, runs the row-local rules of the
+table's pipeline (contact split, zip padding, state abbreviation, name
+capitalization, ...) on each chunk and appends the result to a Parquet
+dataset. Every row is tagged with its position in the input (``_row``) and
+a hash bucket of a key (``bucket``), and the dataset is partitioned on the
+bucket. The key is the names normalized with ``cleaning_dedupe.name_key``
+and is kept as ``_key``, so "Mcgregor" from the capitalized treatments
+lands in the same bucket as, and joins with, "McGregor" in patients.
+
+Rules that look across rows (dedup, joins) then run in a second pass over
+one bucket at a time: rows with the same key always land in the same
+bucket, so ``keyed_pass`` only ever holds one bucket in memory.
+``dedupe_pass`` and ``join_pass`` are the two such passes the notebook
+needs. Each write replaces the partitions already under its output
+directory. Writing Parquet needs pyarrow.
+"""
+import os
+import shutil
+
+import pandas as pd
+
+from cleaning_dedupe import name_key
+from cleaning_pipeline import patients_pipeline, treatments_pipeline
+from cleaning_schema import SCHEMAS, STRING, apply_schema
+
+PIPELINES = {'patients': patients_pipeline, 'treatments': treatments_pipeline}
+DEFAULT_KEYS = {'patients': ['given_name', 'surname'], 'treatments': ['given_name', 'surname']}
+# Columns whose dtype the rules pick from the values in each chunk
+# (compact_uint), fixed to one dtype wide enough for any chunk.
+OUTPUT_DTYPES = {'start_dose': 'UInt32', 'end_dose': 'UInt32'}
+
+
+def join_key(frame, key):
+    """The ``key`` columns normalized with name_key and joined into one string per row."""
+    parts = [name_key(frame[column]).fillna('') for column in key]
+    joined = parts[0]
+    for part in parts[1:]:
+        joined = joined + '|' + part
+    return joined
+
+
+def bucket_of(values, buckets):
+    """Hash bucket of each row of ``values`` (a Series or frame); equal rows always get the same bucket."""
+    return (pd.util.hash_pandas_object(values, index=False) % buckets).astype('int32')
+
+
+def _for_parquet(frame):
+    # Every part has to have the same schema or the dataset can't be read
+    # back. Categories differ from chunk to chunk and a text column can be
+    # all missing in one chunk, so text is always written as strings
+    # (Parquet dictionary-encodes them anyway).
+    dtypes = {}
+    for name, dtype in frame.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(dtype):
+            dtypes[name] = STRING
+    dtypes.update({name: dtype for name, dtype in OUTPUT_DTYPES.items() if name in frame})
+    return frame.astype(dtypes)
+
+
+def _clear(out_dir):
+    # parts from an earlier run with other chunk or bucket counts would
+    # otherwise be read back along with the new ones
+    os.makedirs(out_dir, exist_ok=True)
+    for name in os.listdir(out_dir):
+        if name.startswith('bucket='):
+            shutil.rmtree(os.path.join(out_dir, name))
+
+
+def _write_part(frame, out_dir, name):
+    _for_parquet(frame).to_parquet(out_dir, partition_cols=['bucket'], index=False,
+                     basename_template=name + '-{i}.parquet', existing_data_behavior='overwrite_or_ignore')
+
+
+def clean_in_chunks(table, out_dir, path=None, chunksize=100000, key=None, buckets=16, pipeline=None):
+    """Clean ``table`` chunk by chunk into a Parquet dataset under ``out_dir``.
+
+    Only rules marked ``row_local`` are applied; the rest are left for a
+    keyed second pass. Returns the total number of rows written.
+    """
+    path = path or 'data/{}.csv'.format(table)
+    key = key or DEFAULT_KEYS[table]
+    pipeline = pipeline or PIPELINES[table]()
+    rules = [rule for rule in pipeline.order() if rule.row_local]
+    _clear(out_dir)
+
+    read = written = 0
+    reader = pd.read_csv(path, dtype=SCHEMAS.get(table), chunksize=chunksize)
+    for number, chunk in enumerate(reader):
+        chunk = apply_schema(chunk, table)
+        chunk.index = pd.RangeIndex(read, read + len(chunk))
+        cleaned, _ = pipeline.run(chunk, rules=rules)
+        cleaned['_row'] = cleaned.index.to_numpy()
+        # the raw names, since rules like capitalize_names change them
+        cleaned['_key'] = join_key(chunk.loc[cleaned.index], key)
+        cleaned['bucket'] = bucket_of(cleaned['_key'], buckets)
+        _write_part(cleaned, out_dir, 'chunk-{:06d}'.format(number))
+        read += len(chunk)
+        written += len(cleaned)
+    return written
+
+
+def buckets_in(dataset_dir):
+    """Bucket numbers present in a dataset written by clean_in_chunks."""
+    return sorted(int(name.split('=', 1)[1]) for name in os.listdir(dataset_dir) if name.startswith('bucket='))
+
+
+def read_bucket(dataset_dir, bucket):
+    path = os.path.join(dataset_dir, 'bucket={}'.format(bucket))
+    if not os.path.exists(path):
+        return None
+    frame = pd.read_parquet(path)
+    return frame.assign(bucket=bucket).sort_values('_row', kind='stable').reset_index(drop=True)
+
+
+def keyed_pass(dataset_dir, out_dir, func):
+    """Apply ``func(frame) -> frame`` to one bucket of ``dataset_dir`` at a time."""
+    _clear(out_dir)
+    for bucket in buckets_in(dataset_dir):
+        result = func(read_bucket(dataset_dir, bucket))
+        if len(result):
+            _write_part(result, out_dir, 'bucket-{:06d}'.format(bucket))
+
+
+def dedupe_pass(dataset_dir, out_dir, subset):
+    """Drop rows repeating an earlier row's ``subset`` columns, keeping input order.
+
+    ``subset`` has to include ``_key`` or all the columns the dataset was
+    bucketed on.
+    """
+    keyed_pass(dataset_dir, out_dir, lambda frame: frame.drop_duplicates(subset=list(subset), keep='first'))
+
+
+def _empty_like(dataset_dir):
+    import pyarrow.dataset
+
+    schema = pyarrow.dataset.dataset(dataset_dir, partitioning='hive').schema
+    return schema.empty_table().to_pandas()
+
+
+def join_pass(left_dir, right_dir, out_dir, on=('_key',), how='left', suffixes=('', '_right')):
+    """Join two datasets bucketed on the same key with the same number of buckets.
+
+    ``on`` defaults to the normalized key the datasets were bucketed on.
+    """
+    _clear(out_dir)
+    empty = None
+    for bucket in buckets_in(left_dir):
+        left = read_bucket(left_dir, bucket)
+        right = read_bucket(right_dir, bucket)
+        if right is None:
+            # an empty frame with the right-hand columns and dtypes, so every
+            # part has the joined schema
+            if empty is None:
+                empty = _empty_like(right_dir)
+            right = empty
+        right = right.drop(columns=['bucket', '_row'])
+        joined = left.merge(right, on=list(on), how=how, suffixes=suffixes)
+        if len(joined):
+            _write_part(joined, out_dir, 'bucket-{:06d}'.format(bucket))
@@ -0,0 +1,273 @@
+"""Synthetic study tables at any size, with the defects of the real ones.
+
+``generate`` writes ``patients.csv``, ``treatments.csv`` and
+``adverse_reactions.csv`` in the layout of ``data/``, ``chunksize``
+patients at a time, so the size on disk isn't limited by memory. Names,
+streets and cities are drawn from the bundled tables and zips are drawn
+from the prefix ranges of the patient's state (cleaning_reference), so
+the output looks like the study data without copying any of its records.
+
+Each defect the notebook cleans up is injected at the rate given in
+``RATES`` (override any of them with ``rates=``):
+
+- ``zip_4_digit``: zips of the 0xxxx states written without the leading 0;
+- ``state_full_name``: state written out instead of abbreviated;
+- ``email_first``: email before the phone in ``contact`` (otherwise phone first);
+- ``kg_weight``: weight in kg while the BMI is still from pounds;
+- ``swapped_height``: height with its two digits swapped;
+- ``missing_address``: address, city, state, zip, country and contact all missing;
+- ``duplicate``: a second record for the same person under a nickname;
+- ``john_doe``: the ``John Doe, 123 Main Street`` placeholder record;
+- ``lowercase_names``: treatment and reaction names in lowercase;
+- ``dose_unit_suffix``: doses written ``41u - 48u`` rather than ``41 - 48``;
+- ``missing_hba1c_change``: empty ``hba1c_change``;
+- ``nine_for_four``: a 4 in ``hba1c_change`` misread as 9.
+
+The output depends only on ``seed``, the rates and ``patients``, not on
+``chunksize``.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from cleaning_reference import states, zip3_ranges
+
+RATES = {
+    'zip_4_digit': 1.0,
+    'state_full_name': 0.2,
+    'email_first': 0.4,
+    'kg_weight': 0.002,
+    'swapped_height': 0.002,
+    'missing_address': 0.024,
+    'duplicate': 0.006,
+    'john_doe': 0.012,
+    'lowercase_names': 1.0,
+    'dose_unit_suffix': 1.0,
+    'missing_hba1c_change': 0.39,
+    'nine_for_four': 0.2,
+}
+TREATED = 0.7
+REACTIONS = {'hypoglycemia': 19, 'injection site discomfort': 6, 'headache': 3, 'cough': 2,
+             'throat irritation': 2, 'nausea': 2}
+REACTION_RATE = 0.1
+EMAIL_DOMAINS = ['armyspy.com', 'cuvox.de', 'dayrep.com', 'einrot.com', 'fleckens.hu', 'gustr.com',
+                 'jourrapide.com', 'rhyta.com', 'superrito.com', 'teleworm.us']
+PHONE_FORMATS = ['{a}-{p}-{l}', '+1 ({a}) {p}-{l}', '1 {a} {p} {l}', '({a}) {p}-{l}', '{a}.{p}.{l}']
+JOHN_DOE = {'assigned_sex': 'male', 'given_name': 'John', 'surname': 'Doe', 'address': '123 Main Street',
+            'city': 'New York', 'state': 'NY', 'zip_code': '12345', 'country': 'United States',
+            'contact': 'johndoe@email.com1234567890', 'birthdate': '1/1/1975', 'weight': 180.0,
+            'height': 72, 'bmi': 24.4}
+KG_TO_LB = 2.20462
+# Random draws are made per block of this many patients, each block seeded
+# from (seed, block number), so the output doesn't depend on chunksize
+BLOCK_SIZE = 10000
+
+PATIENT_COLUMNS = ['patient_id', 'assigned_sex', 'given_name', 'surname', 'address', 'city', 'state',
+                   'zip_code', 'country', 'contact', 'birthdate', 'weight', 'height', 'bmi']
+TREATMENT_COLUMNS = ['given_name', 'surname', 'auralin', 'novodra', 'hba1c_start', 'hba1c_end', 'hba1c_change']
+REACTION_COLUMNS = ['given_name', 'surname', 'adverse_reaction']
+
+
+class Vocabulary:
+    """Name, street and city pools from the bundled patients table, and zip ranges by state."""
+
+    def __init__(self, path='data/patients.csv'):
+        patients = pd.read_csv(path, dtype=str)
+        real = patients[patients['surname'] != 'Doe']
+        self.given = {sex: real.loc[real['assigned_sex'] == sex, 'given_name'].unique()
+                      for sex in ('female', 'male')}
+        self.surnames = real['surname'].unique()
+        streets = real['address'].dropna().str.replace(r'^\d+\s+', '', regex=True)
+        self.streets = streets.unique()
+        self.cities = real['city'].dropna().unique()
+
+        zip3 = zip3_ranges()
+        table = states()
+        self.state_names = dict(zip(table['code'], table['name']))
+        # the 50 states and DC, each with its zip prefix ranges
+        self.states = [code for code, kind in zip(table['code'], table['kind']) if kind in ('state', 'district')]
+        self.zip_ranges = {code: [(int(low), int(high)) for low, high in
+                                  zip3.loc[zip3['state'] == code, ['low', 'high']].itertuples(index=False)]
+                           for code in self.states}
+
+
+def _choose(rng, pool, n):
+    return np.asarray(pool, dtype=object)[rng.integers(0, len(pool), n)]
+
+
+def _zips(rng, vocab, state_codes):
+    prefixes = np.empty(len(state_codes), dtype='int64')
+    for code in np.unique(state_codes):
+        rows = np.flatnonzero(state_codes == code)
+        ranges = vocab.zip_ranges[code]
+        picked = rng.integers(0, len(ranges), len(rows))
+        low = np.array([ranges[i][0] for i in picked])
+        high = np.array([ranges[i][1] for i in picked])
+        prefixes[rows] = low + (rng.random(len(rows)) * (high - low + 1)).astype('int64')
+    return prefixes * 100 + rng.integers(0, 100, len(state_codes))
+
+
+def _contacts(rng, given, surname, rates):
+    n = len(given)
+    # area codes as the study's phones have them, [2-9][0-8][0-9]
+    area = rng.integers(2, 10, n) * 100 + rng.integers(0, 9, n) * 10 + rng.integers(0, 10, n)
+    prefix = rng.integers(200, 1000, n)
+    line = rng.integers(0, 10000, n)
+    formats = rng.integers(0, len(PHONE_FORMATS), n)
+    phones = [PHONE_FORMATS[f].format(a=a, p=p, l='{:04d}'.format(l)) for f, a, p, l in zip(formats, area, prefix, line)]
+    domains = _choose(rng, EMAIL_DOMAINS, n)
+    # ASCII letters only, as in the study's emails: Michalčíková -> Michalcikova
+    names = (pd.Series(given + surname, dtype=object).str.normalize('NFKD')
+             .str.encode('ascii', 'ignore').str.decode('ascii').str.replace('[^A-Za-z]', '', regex=True))
+    emails = [name + '@' + d for name, d in zip(names, domains)]
+    email_first = rng.random(n) < rates['email_first']
+    return np.where(email_first, np.char.add(np.array(emails, dtype=str), np.array(phones, dtype=str)),
+                    np.char.add(np.array(phones, dtype=str), np.array(emails, dtype=str))).astype(object)
+
+
+def _patients(rng, vocab, first_id, n, rates):
+    sex = np.where(rng.random(n) < 0.5, 'female', 'male').astype(object)
+    given = np.empty(n, dtype=object)
+    for s in ('female', 'male'):
+        rows = sex == s
+        given[rows] = _choose(rng, vocab.given[s], rows.sum())
+    surname = _choose(rng, vocab.surnames, n)
+    state = _choose(rng, vocab.states, n)
+    zips = _zips(rng, vocab, state)
+    zip_text = np.array(['{:05d}'.format(z) for z in zips], dtype=object)
+    short = (zips < 10000) & (rng.random(n) < rates['zip_4_digit'])
+    zip_text[short] = [str(z) for z in zips[short]]
+
+    full_name = rng.random(n) < rates['state_full_name']
+    state_text = state.copy()
+    state_text[full_name] = [vocab.state_names[code] for code in state[full_name]]
+
+    days = rng.integers(0, (pd.Timestamp('2000-12-31') - pd.Timestamp('1920-01-01')).days, n)
+    born = pd.Timestamp('1920-01-01') + pd.to_timedelta(days, unit='D')
+    height = np.clip(np.round(rng.normal(66.6, 4.4, n)), 58, 79).astype('int64')
+    weight = np.round(np.clip(rng.normal(173.4, 33.9, n), 95, 260), 1)
+    bmi = np.round(703 * weight / height ** 2, 1)
+
+    kg = rng.random(n) < rates['kg_weight']
+    weight[kg] = np.round(weight[kg] / KG_TO_LB, 1)
+    swapped = (rng.random(n) < rates['swapped_height']) & (height % 10 != height // 10)
+    height[swapped] = (height[swapped] % 10) * 10 + height[swapped] // 10
+
+    frame = pd.DataFrame({
+        'patient_id': np.arange(first_id, first_id + n),
+        'assigned_sex': sex,
+        'given_name': given,
+        'surname': surname,
+        'address': np.char.add(np.char.add(rng.integers(1, 5000, n).astype(str), ' '),
+                               _choose(rng, vocab.streets, n).astype(str)).astype(object),
+        'city': _choose(rng, vocab.cities, n),
+        'state': state_text,
+        'zip_code': zip_text,
+        'country': 'United States',
+        'contact': _contacts(rng, given, surname, rates),
+        'birthdate': born.month.astype(str) + '/' + born.day.astype(str) + '/' + born.year.astype(str),
+        'weight': weight,
+        'height': height,
+        'bmi': bmi,
+    })
+    missing = rng.random(n) < rates['missing_address']
+    frame.loc[missing, ['address', 'city', 'state', 'zip_code', 'country', 'contact']] = None
+
+    doe = rng.random(n) < rates['john_doe']
+    for column, value in JOHN_DOE.items():
+        frame.loc[doe, column] = value
+    return frame
+
+
+def _duplicates(rng, patients, rates, next_id):
+    """Second records for some patients under a shortened given name, with new ids."""
+    real = patients[patients['surname'] != 'Doe']
+    picked = real[rng.random(len(real)) < rates['duplicate']].copy()
+    picked['given_name'] = picked['given_name'].str[:4]
+    picked['patient_id'] = np.arange(next_id, next_id + len(picked))
+    return picked
+
+
+def _treatments(rng, patients, rates):
+    treated = patients[(patients['surname'] != 'Doe') & (rng.random(len(patients)) < TREATED)]
+    n = len(treated)
+    start_dose = rng.integers(20, 60, n)
+    end_dose = start_dose + rng.integers(1, 12, n)
+    unit = np.where(rng.random(n) < rates['dose_unit_suffix'], 'u', '')
+    dose = [('{}{u} - {}{u}').format(s, e, u=u) for s, e, u in zip(start_dose, end_dose, unit)]
+    on_auralin = rng.random(n) < 0.5
+
+    start = np.round(rng.uniform(7.5, 8.5, n), 2)
+    change = np.round(rng.uniform(0.2, 0.54, n), 2)
+    end = np.round(start - change, 2)
+    recorded = change.copy()
+    tenths = np.round(change * 100).astype('int64') // 10 % 10
+    misread = (tenths == 4) & (rng.random(n) < rates['nine_for_four'])
+    recorded[misread] = np.round(change[misread] + 0.5, 2)
+    recorded[rng.random(n) < rates['missing_hba1c_change']] = np.nan
+
+    given, surname = treated['given_name'], treated['surname']
+    lower = rng.random(n) < rates['lowercase_names']
+    frame = pd.DataFrame({
+        'given_name': np.where(lower, given.str.lower(), given),
+        'surname': np.where(lower, surname.str.lower(), surname),
+        'auralin': np.where(on_auralin, dose, '-'),
+        'novodra': np.where(on_auralin, '-', dose),
+        'hba1c_start': start,
+        'hba1c_end': end,
+        'hba1c_change': recorded,
+    })
+    reactions = frame[rng.random(n) < REACTION_RATE][['given_name', 'surname']].copy()
+    weights = np.array(list(REACTIONS.values()), dtype='float64')
+    picked = rng.choice(len(REACTIONS), len(reactions), p=weights / weights.sum())
+    reactions['adverse_reaction'] = np.array(list(REACTIONS), dtype=object)[picked]
+    return frame, reactions
+
+
+def _blocks(vocab, patients, seed, rates):
+    """``(patients, treatments, reactions)`` frames for each block of BLOCK_SIZE patients."""
+    # duplicates take ids after all the generated patients
+    next_duplicate_id = patients + 1
+    for number, first in enumerate(range(0, patients, BLOCK_SIZE)):
+        rng = np.random.default_rng([seed, number])
+        block = _patients(rng, vocab, first + 1, min(BLOCK_SIZE, patients - first), rates)
+        duplicates = _duplicates(rng, block, rates, next_duplicate_id)
+        next_duplicate_id += len(duplicates)
+        treatments, reactions = _treatments(rng, block, rates)
+        yield pd.concat([block, duplicates]), treatments, reactions
+
+
+def generate(out_dir='synthetic', patients=1000000, chunksize=100000, seed=0, rates=None, vocabulary=None):
+    """Write the three tables for ``patients`` patients under ``out_dir``; returns the row counts.
+
+    ``chunksize`` only sets how many patients are held in memory between
+    writes (rounded up to whole blocks); it doesn't change the output.
+    """
+    rates = dict(RATES, **(rates or {}))
+    unknown = set(rates) - set(RATES)
+    if unknown:
+        raise ValueError('unknown defect rates: ' + ', '.join(sorted(unknown)))
+    vocab = vocabulary or Vocabulary()
+    os.makedirs(out_dir, exist_ok=True)
+    names = ('patients', 'treatments', 'adverse_reactions')
+    columns = dict(zip(names, (PATIENT_COLUMNS, TREATMENT_COLUMNS, REACTION_COLUMNS)))
+    paths = {name: os.path.join(out_dir, name + '.csv') for name in names}
+    counts = dict.fromkeys(paths, 0)
+
+    def write(pending):
+        first = counts['patients'] == 0
+        for name, frames in zip(names, zip(*pending)):
+            frame = pd.concat(frames)
+            frame[columns[name]].to_csv(paths[name], mode='w' if first else 'a', header=first, index=False)
+            counts[name] += len(frame)
+
+    pending = []
+    for frames in _blocks(vocab, patients, seed, rates):
+        pending.append(frames)
+        if len(pending) * BLOCK_SIZE >= chunksize:
+            write(pending)
+            pending = []
+    if pending:
+        write(pending)
+    return counts
@@ -0,0 +1,104 @@
+"""Detect and repair unit and transcription errors in vitals.
+
+``cleaning-student.py`` found Zaitseva's weight recorded in kg and
+Neudorf's height typed as 27 instead of 72 by hand, and patched them with
+``.loc`` edits (the kg fix on the original ``patients`` instead of the
+cleaned copy). Here every row's BMI is recomputed (``703 * lb / in²``) and
+rows that disagree with their recorded BMI get candidate repairs:
+
+- ``kg_to_lb``: the weight was in kilograms;
+- ``swap_height_digits``: the two digits of the height were swapped.
+
+A candidate is only proposed when it brings the recomputed BMI back within
+``tolerance`` of the recorded one. Treatments get the same treatment for
+HbA1c: where ``hba1c_change`` isn't ``hba1c_start - hba1c_end``, each 9
+digit of the three values is tried as the 4 it was misread from.
+
+``find_*_repairs`` return one row per repair (row, column, old and new
+value, kind) so they can be reviewed, and ``apply_repairs`` applies a
+batch of them to a copy of the table.
+"""
+import pandas as pd
+
+KG_TO_LB = 2.20462
+BMI_TOLERANCE = 0.1
+HBA1C_TOLERANCE = 1e-6
+HBA1C_COLUMNS = ['hba1c_change', 'hba1c_start', 'hba1c_end']
+
+REPAIR_COLUMNS = ['column', 'old', 'new', 'repair']
+
+
+def bmi(weight, height):
+    """BMI from weight in pounds and height in inches."""
+    return 703 * weight.astype('float64') / height.astype('float64') ** 2
+
+
+def swap_digits(values):
+    """Two-digit values with their digits swapped (27 -> 72); NaN for anything else."""
+    values = values.astype('float64')
+    two_digit = (values >= 10) & (values <= 99) & (values % 1 == 0)
+    swapped = (values % 10) * 10 + values // 10
+    return swapped.where(two_digit)
+
+
+def _repairs(index, column, old, new, repair):
+    return pd.DataFrame({'column': column, 'old': old, 'new': new, 'repair': repair}, index=index)
+
+
+def find_vitals_repairs(patients, tolerance=BMI_TOLERANCE):
+    """Candidate weight and height repairs for rows whose BMI doesn't add up."""
+    weight, height, recorded = patients['weight'], patients['height'], patients['bmi']
+    wrong = (bmi(weight, height) - recorded).abs() > tolerance
+
+    candidates = [
+        ('weight', 'kg_to_lb', (weight.astype('float64') * KG_TO_LB).round(1), height),
+        ('height', 'swap_height_digits', weight, swap_digits(height)),
+    ]
+    repairs = []
+    fixed = pd.Series(False, index=patients.index)
+    for column, repair, new_weight, new_height in candidates:
+        agrees = wrong & ~fixed & ((bmi(new_weight, new_height) - recorded).abs() <= tolerance)
+        new = new_weight if column == 'weight' else new_height
+        repairs.append(_repairs(patients.index[agrees], column, patients.loc[agrees, column].astype('float64'),
+                                new[agrees], repair))
+        fixed |= agrees
+    return pd.concat(repairs)[REPAIR_COLUMNS]
+
+
+def misread_nines(values):
+    """One candidate per 9 digit in the hundredths, tenths and units: that 9 read as a 4.
+
+    Returns a list of Series aligned with ``values``, NaN where that digit isn't a 9.
+    """
+    hundredths = (values.astype('float64') * 100).round()
+    candidates = []
+    for place in (1, 10, 100):
+        digit = (hundredths // place) % 10
+        candidates.append(((hundredths - 5 * place) / 100).where(digit == 9))
+    return candidates
+
+
+def find_hba1c_repairs(treatments, tolerance=HBA1C_TOLERANCE):
+    """Candidate 9-for-4 repairs for rows where hba1c_change isn't start minus end."""
+    values = {name: treatments[name].astype('float64') for name in HBA1C_COLUMNS}
+    wrong = (values['hba1c_start'] - values['hba1c_end'] - values['hba1c_change']).abs() > tolerance
+
+    repairs = []
+    fixed = pd.Series(False, index=treatments.index)
+    for column in HBA1C_COLUMNS:
+        for candidate in misread_nines(values[column]):
+            trial = dict(values, **{column: candidate})
+            agrees = wrong & ~fixed & ((trial['hba1c_start'] - trial['hba1c_end'] - trial['hba1c_change']).abs()
+                                       <= tolerance)
+            repairs.append(_repairs(treatments.index[agrees], column, values[column][agrees], candidate[agrees],
+                                    'nine_for_four'))
+            fixed |= agrees
+    return pd.concat(repairs)[REPAIR_COLUMNS]
+
+
+def apply_repairs(frame, repairs):
+    """Copy of ``frame`` with every repair applied, one vectorized assignment per column."""
+    repaired = frame.copy()
+    for column, batch in repairs.groupby('column'):
+        repaired.loc[batch.index, column] = batch['new'].astype(repaired[column].dtype)
+    return repaired
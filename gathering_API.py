@@ -22,3 +22,8 @@ page = wptools.page('E.T. the Extra-Terrestrial').get()
 page.data['image']
 
 
+# Reruns can read the same metadata from the local cache instead
+from gathering_cache import ResponseCache
+from gathering_posters import get_images
+cache = ResponseCache('gather_cache')
+get_images('E.T. the Extra-Terrestrial', cache=cache)
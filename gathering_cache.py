@@ -0,0 +1,223 @@
+"""On-disk cache for the gathering step.
+
+Responses (poster bytes, wptools page metadata) are stored content-addressed
+under ``<root>/objects/`` by their sha256, with a small sqlite index mapping
+each cache key (a URL or ``wptools:<title>``) to its blob along with the
+ETag/Last-Modified headers needed to revalidate it. Once the blobs go over
+``max_bytes`` the least recently used entries are evicted.
+
+With ``offline=True`` nothing touches the network and a miss raises
+``CacheMiss``, so a whole gathering run can be replayed from disk.
+
+Keys being read are pinned, so another thread's eviction can't delete a
+blob between looking it up and opening it; ``fetch_file`` hands back an
+open file for that reason rather than a path.
+"""
+import collections
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+class CacheMiss(LookupError):
+    """Raised for an uncached key when the cache is offline."""
+
+
+class ResponseCache:
+
+    def __init__(self, root='gather_cache', max_bytes=512 * 1024 ** 2, offline=False):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._objects = os.path.join(root, 'objects')
+        os.makedirs(self._objects, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pinned = collections.Counter()
+        self._db = sqlite3.connect(os.path.join(root, 'index.sqlite3'), check_same_thread=False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS entries ('
+                             'key TEXT PRIMARY KEY, digest TEXT NOT NULL, size INTEGER NOT NULL, '
+                             'etag TEXT, last_modified TEXT, accessed REAL NOT NULL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+
+    def _path(self, digest):
+        return os.path.join(self._objects, digest[:2], digest)
+
+    def _lookup(self, key):
+        with self._lock:
+            return self._db.execute('SELECT digest, etag, last_modified FROM entries WHERE key = ?',
+                                    (key,)).fetchone()
+
+    def _touch(self, key):
+        with self._lock, self._db:
+            self._db.execute('UPDATE entries SET accessed = ? WHERE key = ?', (time.time(), key))
+
+    @contextlib.contextmanager
+    def pinned(self, key):
+        """Keep ``key`` from being evicted while the block runs."""
+        with self._lock:
+            self._pinned[key] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pinned[key] -= 1
+                if not self._pinned[key]:
+                    del self._pinned[key]
+
+    def path(self, key):
+        """Path of the cached blob for ``key``, or None."""
+        row = self._lookup(key)
+        if row is None:
+            return None
+        path = self._path(row[0])
+        if not os.path.exists(path):
+            # blob removed behind our back, drop the stale entry
+            with self._lock, self._db:
+                self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            return None
+        self._touch(key)
+        return path
+
+    def get(self, key):
+        """Cached bytes for ``key``, or None."""
+        with self.pinned(key):
+            path = self.path(key)
+            if path is None:
+                return None
+            with open(path, 'rb') as f:
+                return f.read()
+
+    def put_stream(self, key, chunks, etag=None, last_modified=None):
+        """Store an iterable of byte chunks under ``key`` and return the blob path.
+
+        The chunks are hashed while they are written, so the body is never
+        held in memory as a whole.
+        """
+        sha = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=self._objects)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    sha.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            # e.g. a read timeout mid-download; the partial body isn't in the
+            # index, so nothing else would ever remove it
+            os.remove(tmp)
+            raise
+        digest = sha.hexdigest()
+        path = self._path(digest)
+        if os.path.exists(path):
+            os.remove(tmp)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp, path)
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)',
+                             (key, digest, size, etag, last_modified, time.time()))
+        self.evict(keep=key)
+        return path
+
+    def put(self, key, content, etag=None, last_modified=None):
+        return self.put_stream(key, [content], etag, last_modified)
+
+    def get_json(self, key):
+        content = self.get(key)
+        return None if content is None else json.loads(content.decode('utf-8'))
+
+    def put_json(self, key, value):
+        self.put(key, json.dumps(value, sort_keys=True).encode('utf-8'))
+
+    def fetch_path(self, session, url, revalidate=False, timeout=30, chunk_size=64 * 1024):
+        """GET ``url`` through the cache and return the path of the cached body.
+
+        A cached body is returned as is unless ``revalidate`` is set, in which
+        case a conditional request is made and the body is only downloaded
+        again if the server says it changed. Downloads are streamed straight
+        into the cache.
+
+        The blob can be evicted by another thread once this returns; use
+        ``fetch_file`` to read it safely.
+        """
+        row = self._lookup(url)
+        if row is not None and (not revalidate or self.offline):
+            path = self.path(url)
+            if path is not None:
+                return path
+            row = None
+        if self.offline:
+            raise CacheMiss(url)
+
+        headers = {}
+        if row is not None:
+            if row[1]:
+                headers['If-None-Match'] = row[1]
+            if row[2]:
+                headers['If-Modified-Since'] = row[2]
+        with session.get(url, headers=headers, timeout=timeout, stream=True) as r:
+            if r.status_code == 304 and row is not None:
+                path = self.path(url)
+                if path is not None:
+                    return path
+                return self.fetch_path(session, url, False, timeout, chunk_size)
+            r.raise_for_status()
+            return self.put_stream(url, r.iter_content(chunk_size), r.headers.get('ETag'),
+                                   r.headers.get('Last-Modified'))
+
+    def fetch_file(self, session, url, revalidate=False, timeout=30):
+        """Same as ``fetch_path`` but returns the cached body opened for reading.
+
+        The key is pinned until the file is open, and an open file stays
+        readable even if the blob is evicted afterwards.
+        """
+        with self.pinned(url):
+            return open(self.fetch_path(session, url, revalidate, timeout), 'rb')
+
+    def fetch(self, session, url, revalidate=False, timeout=30):
+        """Same as ``fetch_path`` but returns the body itself."""
+        with self.fetch_file(session, url, revalidate, timeout) as f:
+            return f.read()
+
+    def size(self):
+        """Bytes used by blobs that are still referenced."""
+        with self._lock:
+            return self._db.execute('SELECT COALESCE(SUM(size), 0) FROM '
+                                    '(SELECT DISTINCT digest, size FROM entries)').fetchone()[0]
+
+    def evict(self, keep=None):
+        """Drop least recently used entries until the blobs fit in ``max_bytes``.
+
+        ``keep`` and pinned keys are never evicted, so a blob that was just
+        stored or is being read stays readable even if it is bigger than
+        the whole budget.
+        """
+        if self.size() <= self.max_bytes:
+            return
+        with self._lock, self._db:
+            rows = self._db.execute('SELECT key, digest FROM entries ORDER BY accessed').fetchall()
+            total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM '
+                                     '(SELECT DISTINCT digest, size FROM entries)').fetchone()[0]
+            for key, digest in rows:
+                if total <= self.max_bytes:
+                    break
+                if key == keep or key in self._pinned:
+                    continue
+                self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+                shared = self._db.execute('SELECT size FROM entries WHERE digest = ? LIMIT 1',
+                                          (digest,)).fetchone()
+                if shared is None:
+                    path = self._path(digest)
+                    if os.path.exists(path):
+                        total -= os.path.getsize(path)
+                        os.remove(path)
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,67 @@
+"""Lazily loaded reader for the Roger Ebert review files.
+
+Every file in ``ebert_reviews/`` is ``<ranking>-<slug>.txt`` with the title
+on line 1, the review URL on line 2 and the review body after that. Building
+the corpus only reads those two header lines per file; the result is a
+small table of (ranking, slug, title, url, offset, length) where offset and
+length locate the body in its file. Bodies are sliced out of a memory map
+when asked for, so the metadata for a large archive costs a few short
+strings per review instead of every review's text.
+"""
+import mmap
+import os
+
+import pandas as pd
+
+
+def _scan(path):
+    with open(path, 'rb') as f:
+        title = f.readline().decode('utf-8').strip()
+        url = f.readline().decode('utf-8').strip()
+        offset = f.tell()
+        size = os.fstat(f.fileno()).st_size
+    return title, url, offset, size - offset
+
+
+class EbertCorpus:
+
+    def __init__(self, folder='ebert_reviews'):
+        self.folder = folder
+        rows = []
+        for file_name in os.listdir(folder):
+            stem, ext = os.path.splitext(file_name)
+            ranking, _, slug = stem.partition('-')
+            if ext != '.txt' or not ranking.isdigit():
+                continue
+            title, url, offset, length = _scan(os.path.join(folder, file_name))
+            rows.append((int(ranking), slug, title, url, offset, length, file_name))
+
+        table = pd.DataFrame(rows, columns=['ranking', 'slug', 'title', 'url', 'offset', 'length',
+                                            'file_name'])
+        table = table.sort_values('ranking').reset_index(drop=True)
+        self.table = table.astype({'ranking': 'int32', 'offset': 'int32', 'length': 'int32'})
+        self._by_ranking = dict(zip(self.table.ranking, self.table.index))
+
+    def __len__(self):
+        return len(self.table)
+
+    def path(self, ranking):
+        return os.path.join(self.folder, self.table.file_name[self._by_ranking[ranking]])
+
+    def body_bytes(self, ranking):
+        """Raw body of the review at ``ranking``, read through a memory map."""
+        row = self.table.loc[self._by_ranking[ranking]]
+        if row.length == 0:
+            return b''
+        with open(self.path(ranking), 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                return m[row.offset:row.offset + row.length]
+
+    def body(self, ranking):
+        """Body text of the review at ``ranking``."""
+        return self.body_bytes(ranking).decode('utf-8')
+
+    def bodies(self):
+        """(ranking, body) for every review, one at a time."""
+        for ranking in self.table.ranking:
+            yield int(ranking), self.body(ranking)
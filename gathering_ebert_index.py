@@ -0,0 +1,193 @@
+"""On-disk inverted index with BM25 ranking over the Ebert reviews.
+
+The index lives in a folder (``ebert_index/`` by default) with three files:
+
+- ``postings.bin``: one zlib-compressed block per term, holding varint
+  encoded (ranking delta, term frequency) pairs
+- ``lexicon.json``: term -> [offset, size, document frequency] into
+  postings.bin
+- ``docs.json``: ranking -> file name, mtime, size and token count
+
+Documents are keyed by the ranking prefix of their file name, so hits join
+straight back to ``bestofrt.tsv``. A query only reads and decompresses the
+blocks of its own terms. ``update()`` re-tokenizes just the files whose
+mtime or size changed (or that were added or removed) since the last build.
+It still rewrites the whole of postings.bin, streaming it term by term:
+unchanged blocks are copied as they are and only the postings of the
+re-tokenized files are held in memory.
+"""
+import json
+import math
+import os
+import re
+import zlib
+from collections import Counter
+
+from gathering_ebert import EbertCorpus
+
+TOKEN_RE = re.compile(r"[^\W_]+")
+
+
+def tokenize(text):
+    """Lowercased word tokens, with apostrophes dropped so "Hitchcock's" -> "hitchcocks"."""
+    return TOKEN_RE.findall(text.lower().replace("'", '').replace('’', ''))
+
+
+def _encode(postings):
+    """Varint-encode sorted (ranking, tf) pairs with delta rankings."""
+    out = bytearray()
+    previous = 0
+    for ranking, tf in postings:
+        for value in (ranking - previous, tf):
+            while value >= 0x80:
+                out.append((value & 0x7f) | 0x80)
+                value >>= 7
+            out.append(value)
+        previous = ranking
+    return zlib.compress(bytes(out))
+
+
+def _decode(block):
+    data = zlib.decompress(block)
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    postings = []
+    ranking = 0
+    for i in range(0, len(values), 2):
+        ranking += values[i]
+        postings.append((ranking, values[i + 1]))
+    return postings
+
+
+class EbertIndex:
+
+    def __init__(self, index_dir='ebert_index', reviews_dir='ebert_reviews', k1=1.2, b=0.75):
+        self.index_dir = index_dir
+        self.reviews_dir = reviews_dir
+        self.k1 = k1
+        self.b = b
+        self.docs = {}
+        self.lexicon = {}
+        if os.path.exists(os.path.join(index_dir, 'lexicon.json')):
+            with open(os.path.join(index_dir, 'docs.json'), encoding='utf-8') as f:
+                self.docs = {int(ranking): doc for ranking, doc in json.load(f).items()}
+            with open(os.path.join(index_dir, 'lexicon.json'), encoding='utf-8') as f:
+                self.lexicon = json.load(f)
+        self._avgdl = self._mean_length()
+
+    def _mean_length(self):
+        return sum(doc['length'] for doc in self.docs.values()) / len(self.docs) if self.docs else 0.0
+
+    def postings(self, term):
+        """[(ranking, tf), ...] for ``term``, read from disk."""
+        entry = self.lexicon.get(term)
+        if entry is None:
+            return []
+        offset, size, _ = entry
+        with open(os.path.join(self.index_dir, 'postings.bin'), 'rb') as f:
+            f.seek(offset)
+            return _decode(f.read(size))
+
+    def update(self):
+        """Bring the index in line with ``reviews_dir``; returns the rankings re-indexed."""
+        corpus = EbertCorpus(self.reviews_dir)
+        current = {}
+        for ranking, file_name in zip(corpus.table.ranking, corpus.table.file_name):
+            st = os.stat(os.path.join(self.reviews_dir, file_name))
+            current[int(ranking)] = {'file_name': file_name, 'mtime': st.st_mtime, 'size': st.st_size}
+
+        changed = [ranking for ranking, doc in current.items()
+                   if ranking not in self.docs
+                   or (self.docs[ranking]['file_name'], self.docs[ranking]['mtime'], self.docs[ranking]['size'])
+                   != (doc['file_name'], doc['mtime'], doc['size'])]
+        stale = set(changed) | (set(self.docs) - set(current))
+        if not stale:
+            return []
+
+        docs = {ranking: doc for ranking, doc in self.docs.items() if ranking not in stale}
+        added = {}
+        for ranking in changed:
+            tokens = tokenize(corpus.body(ranking))
+            for term, tf in Counter(tokens).items():
+                added.setdefault(term, {})[ranking] = tf
+            docs[ranking] = dict(current[ranking], length=len(tokens))
+
+        self._write(stale, added, docs)
+        return sorted(changed)
+
+    def _write(self, stale, added, docs):
+        """Rewrite postings.bin in one pass, dropping ``stale`` rankings and merging in ``added``.
+
+        Blocks are read one term at a time, and a block that doesn't
+        change is copied as is, so only the postings of the re-tokenized
+        documents are ever held in memory.
+        """
+        os.makedirs(self.index_dir, exist_ok=True)
+        path = os.path.join(self.index_dir, 'postings.bin')
+        lexicon = {}
+        tmp = path + '.tmp'
+        source = open(path, 'rb') if self.lexicon else None
+        try:
+            with open(tmp, 'wb') as f:
+                for term in sorted(set(self.lexicon) | set(added)):
+                    postings = {}
+                    if term in self.lexicon:
+                        offset, size, _ = self.lexicon[term]
+                        source.seek(offset)
+                        block = source.read(size)
+                        postings = {ranking: tf for ranking, tf in _decode(block) if ranking not in stale}
+                        if term not in added and len(postings) == self.lexicon[term][2]:
+                            # untouched: copy the compressed block as is
+                            lexicon[term] = [f.tell(), size, len(postings)]
+                            f.write(block)
+                            continue
+                    postings.update(added.get(term, {}))
+                    if not postings:
+                        continue
+                    block = _encode(sorted(postings.items()))
+                    lexicon[term] = [f.tell(), len(block), len(postings)]
+                    f.write(block)
+        finally:
+            if source is not None:
+                source.close()
+        os.replace(tmp, path)
+        for name, value in (('lexicon.json', lexicon), ('docs.json', docs)):
+            tmp = os.path.join(self.index_dir, name + '.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp, os.path.join(self.index_dir, name))
+        self.docs = docs
+        self.lexicon = lexicon
+        self._avgdl = self._mean_length()
+
+    def idf(self, term):
+        n = len(self.docs)
+        df = self.lexicon[term][2] if term in self.lexicon else 0
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query, k=10, require_all=False):
+        """Top ``k`` (ranking, score) pairs for ``query`` by BM25.
+
+        ``require_all`` keeps only reviews containing every query term.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        scores = Counter()
+        matched = Counter()
+        for term in terms:
+            idf = self.idf(term)
+            for ranking, tf in self.postings(term):
+                dl = self.docs[ranking]['length']
+                norm = self.k1 * (1 - self.b + self.b * dl / self._avgdl)
+                scores[ranking] += idf * tf * (self.k1 + 1) / (tf + norm)
+                matched[ranking] += 1
+        if require_all:
+            scores = Counter({ranking: score for ranking, score in scores.items()
+                              if matched[ranking] == len(terms)})
+        return scores.most_common(k)
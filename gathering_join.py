@@ -0,0 +1,159 @@
+"""Join the four movie mashup sources on one canonical title key.
+
+Each source names the same film differently:
+
+- bestofrt.tsv: ``Citizen Kane (1941)``
+- rt-html pages: ``<title>`` minus " - Rotten Tomatoes", with a non-breaking
+  space before the year
+- ebert_reviews: file slugs like ``22-a-hard-day27s-night-film`` (``27`` is
+  what is left of a percent-encoded apostrophe)
+- gathering_mashup.py: Wikipedia titles like ``A_Hard_Day%27s_Night_(film)``
+
+``canonical_key`` turns all of these into the same string (here
+``hard days night``): accents, years, parentheticals, punctuation and a
+leading article are dropped. Keys are computed once per source and the
+sources are hash-joined onto bestofrt.tsv. Rows left over are matched on
+their words when that is unambiguous; rows that still don't find a partner,
+or whose key is shared with another row in the same source, go to the
+report instead.
+"""
+import re
+import unicodedata
+from urllib.parse import unquote
+
+import pandas as pd
+
+PARENTHETICAL_RE = re.compile(r'\([^)]*\)')
+SLUG_APOSTROPHE_RE = re.compile(r'(?<=[a-z])27(?=[a-z])')
+SLUG_SUFFIX_RE = re.compile(r'(-(19|20)\d\d)?-film$|-(19|20)\d\d$')
+NON_ALNUM_RE = re.compile(r'[^a-z0-9]+')
+ARTICLES = ('the ', 'a ', 'an ')
+
+
+def canonical_key(title):
+    """Source-independent key for a film title."""
+    text = unicodedata.normalize('NFKD', title)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = PARENTHETICAL_RE.sub(' ', text).lower()
+    text = text.replace("'", '').replace('’', '')
+    text = NON_ALNUM_RE.sub(' ', text).strip()
+    for article in ARTICLES:
+        if text.startswith(article):
+            text = text[len(article):]
+            break
+    return text
+
+
+def wiki_key(title):
+    """Key for a Wikipedia URL title like ``A_Hard_Day%27s_Night_(film)``."""
+    return canonical_key(unquote(title).replace('_', ' '))
+
+
+def slug_key(slug):
+    """Key for an Ebert review slug like ``a-hard-day27s-night-film``."""
+    slug = SLUG_APOSTROPHE_RE.sub('', slug.lower())
+    slug = SLUG_SUFFIX_RE.sub('', slug)
+    return canonical_key(slug.replace('-', ' '))
+
+
+def _index(source, frame, report):
+    """Keep rows whose key is unique within ``frame``; report the rest."""
+    dupes = frame.key.duplicated(keep=False)
+    for row in frame[dupes].itertuples():
+        report.append({'source': source, 'title': row.source_title, 'key': row.key,
+                       'reason': 'ambiguous key'})
+    return frame[~dupes]
+
+
+def _token_matches(keys, master_keys):
+    """Match leftover keys whose words are a subset or superset of exactly one master key's.
+
+    Catches alternate titles like "Nosferatu" vs "Nosferatu, a Symphony of
+    Horror" or "Rome, Open City" vs "Open City". Only keys left over after the
+    exact join are compared, through a word -> master key index.
+    """
+    tokens = {key: set(key.split()) for key in master_keys}
+    by_word = {}
+    for key, words in tokens.items():
+        for word in words:
+            by_word.setdefault(word, set()).add(key)
+    claimed = {}
+    for key in keys:
+        words = set(key.split())
+        candidates = set().union(*(by_word.get(word, set()) for word in words))
+        hits = [m for m in candidates if words <= tokens[m] or tokens[m] <= words]
+        if len(hits) == 1:
+            claimed.setdefault(hits[0], []).append(key)
+    # a master key claimed by two leftovers is as ambiguous as no match
+    return {keys[0]: master for master, keys in claimed.items() if len(keys) == 1}
+
+
+def join_sources(bestofrt, rt, ebert, wiki_titles):
+    """Master table of every film in ``bestofrt`` with its RT, Ebert and Wikipedia data.
+
+    ``bestofrt`` is the bestofrt.tsv frame, ``rt`` the frame from
+    ``gathering_rt.extract_rt_folder``, ``ebert`` the ``table`` of a
+    ``gathering_ebert.EbertCorpus`` and ``wiki_titles`` the title list from
+    gathering_mashup.py. Returns ``(master, report)`` where report lists the
+    rows that couldn't be matched. ``<source>_match`` in the master says how
+    each source was matched: 'key', 'words' (see ``_token_matches``) or
+    missing.
+    """
+    report = []
+    master = bestofrt.assign(key=bestofrt.title.map(canonical_key), source_title=bestofrt.title)
+    master = _index('bestofrt', master, report).reset_index(drop=True)
+    master_index = dict(zip(master.key, master.index))
+
+    sources = {
+        'rt': rt.assign(key=rt.title.map(canonical_key), source_title=rt.title)
+                .drop(columns='title'),
+        'ebert': ebert[['ranking', 'slug', 'url']]
+                .rename(columns={'ranking': 'ebert_ranking', 'slug': 'ebert_slug', 'url': 'ebert_url'})
+                .assign(key=ebert.slug.map(slug_key), source_title=ebert.slug),
+        'wiki': pd.DataFrame({'wiki_title': list(wiki_titles)})
+                .assign(key=lambda df: df.wiki_title.map(wiki_key), source_title=lambda df: df.wiki_title),
+    }
+
+    columns = [master.drop(columns='source_title')]
+    for source, frame in sources.items():
+        frame = _index(source, frame, report)
+        position = frame.key.map(master_index)
+        how = pd.Series('key', index=frame.index).where(position.notna())
+
+        leftover = frame.key[position.isna()]
+        taken = set(position.dropna())
+        free = [key for key, i in master_index.items() if i not in taken]
+        fuzzy = _token_matches(list(leftover), free)
+        fuzzy_position = leftover.map(fuzzy).map(master_index)
+        position = position.fillna(fuzzy_position)
+        how = how.fillna(pd.Series('words', index=fuzzy_position.dropna().index))
+
+        for row in frame[position.isna()].itertuples():
+            report.append({'source': source, 'title': row.source_title, 'key': row.key,
+                           'reason': 'no match in bestofrt'})
+        matched = frame[position.notna()].drop(columns=['key', 'source_title'])
+        # nullable ints so films missing from this source don't turn the column into floats
+        matched = matched.astype({c: 'Int64' for c in matched.select_dtypes('integer').columns})
+        matched = matched.assign(**{source + '_match': how[position.notna()]})
+        matched.index = position.dropna().astype(int)
+        columns.append(matched)
+
+    master = pd.concat(columns, axis=1)
+    for row in master.itertuples():
+        missing = [source for source in sources if pd.isna(getattr(row, source + '_match'))]
+        if missing:
+            report.append({'source': 'bestofrt', 'title': row.title, 'key': row.key,
+                           'reason': 'no match in ' + ', '.join(missing)})
+
+    master = master.sort_values('ranking').reset_index(drop=True)
+    report = pd.DataFrame(report, columns=['source', 'title', 'key', 'reason'])
+    return master, report
+
+
+def load_sources(bestofrt_path='bestofrt.tsv', rt_folder='rt-html', ebert_folder='ebert_reviews'):
+    """(bestofrt, rt, ebert) frames from the files bundled with the repo."""
+    from gathering_ebert import EbertCorpus
+    from gathering_rt import extract_rt_folder
+
+    bestofrt = pd.read_csv(bestofrt_path, sep='\t')
+    return bestofrt, extract_rt_folder(rt_folder), EbertCorpus(ebert_folder).table
@@ -0,0 +1,115 @@
+"""Checkpointing and retries for the poster gathering run.
+
+Every title that is attempted gets a line appended to a JSON-lines manifest
+with its status, URL, byte count and sha256. A rerun reads the manifest back
+and skips titles whose poster is already on disk, so an interrupted run
+picks up where it stopped instead of at ranking 1.
+
+Posters Wikipedia can't give us (the ranks 22, 53, 72 and 93 cases in
+gathering_mashup.py) come from a CSV lookup file of ``title,url`` rows rather
+than an if-chain in the notebook.
+"""
+import csv
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+
+# HTTP statuses worth another try
+TRANSIENT_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+def is_transient(exc):
+    """True for network errors and HTTP statuses that may succeed on retry."""
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code in TRANSIENT_STATUSES
+    return False
+
+
+def retry(fn, attempts=4, base_delay=1.0, max_delay=30.0, transient=is_transient):
+    """Call ``fn()`` and retry transient failures with exponential backoff.
+
+    Waits ``base_delay * 2**n`` seconds (capped at ``max_delay``, with some
+    jitter) between attempts. Errors that aren't transient are raised right
+    away.
+    """
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == attempts - 1 or not transient(e):
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt)
+            time.sleep(delay * random.uniform(0.5, 1.0))
+
+
+def load_overrides(path='poster_overrides.csv'):
+    """Dict of title -> poster URL from a ``title,url`` CSV, empty if it's missing."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, newline='', encoding='utf-8') as f:
+        return {row['title']: row['url'] for row in csv.DictReader(f)}
+
+
+def file_digest(path, chunk_size=64 * 1024):
+    """Byte count and sha256 hex digest of a file."""
+    sha = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+            size += len(chunk)
+    return size, sha.hexdigest()
+
+
+class Manifest:
+    """Append-only JSON-lines record of every title a gathering run attempted."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.latest = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # a run killed mid-write can leave a partial last line
+                        continue
+                    self.latest[entry['title']] = entry
+
+    def completed(self, title):
+        """The last 'done' entry for ``title`` if its poster is still on disk, else None."""
+        entry = self.latest.get(title)
+        if entry and entry['status'] == 'done' and os.path.exists(entry['path']):
+            return entry
+        return None
+
+    def record(self, ranking, title, status, url=None, path=None, error=None):
+        entry = {'ranking': int(ranking),
+                 'title': title,
+                 'status': status,
+                 'url': url,
+                 'path': path,
+                 'bytes': None,
+                 'sha256': None,
+                 'error': error,
+                 'time': time.time()}
+        if path is not None and os.path.exists(path):
+            entry['bytes'], entry['sha256'] = file_digest(path)
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+            self.latest[title] = entry
+        return entry
@@ -0,0 +1,281 @@
+"""Parallel version of the poster loop in gathering_mashup.py.
+
+Titles are processed on a thread pool since the loop is almost all network
+wait. Poster downloads share one keep-alive session, every request has a
+timeout, and the number of in-flight requests per host is capped so a long
+title list doesn't hammer Wikipedia.
+
+The outputs are the same as the notebook loop: ``df_list`` (one dict per
+poster with ranking, title and poster_url) and ``image_errors`` (the image
+list for every ``<ranking>_<title>`` that failed).
+
+Posters are streamed to disk as downloaded instead of going through a PIL
+decode and re-encode, and the extension comes from the image's magic bytes.
+
+Pass a ``gathering_cache.ResponseCache`` to reuse page metadata and poster
+bytes from earlier runs instead of downloading them again, a
+``gathering_manifest.Manifest`` to make the run resumable, and a
+``gathering_trace.Tracer`` to record every stage and request instead of
+printing failures.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+import wptools
+from requests.adapters import HTTPAdapter
+
+from gathering_cache import CacheMiss
+from gathering_manifest import retry
+from gathering_trace import error_class, traced
+from gathering_wiki import API_URL, BATCH_SIZE, resolve_lead_images
+
+WIKIPEDIA_HOST = 'en.wikipedia.org'
+
+
+def make_session(pool_size=10):
+    """requests.Session whose connection pool is big enough for the workers."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class HostLimiter:
+    """Hands out one bounded semaphore per host."""
+
+    def __init__(self, per_host=4):
+        self.per_host = per_host
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def __call__(self, url_or_host):
+        host = urlsplit(url_or_host).netloc or url_or_host
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host)
+            return self._semaphores[host]
+
+
+def get_images(title, limiter=None, timeout=30, cache=None, tracer=None):
+    """Image list for a Wikipedia page, same as ``page.data['image']``."""
+    key = 'wptools:' + title
+    if cache is not None:
+        images = cache.get_json(key)
+        if images is not None:
+            return images
+        if cache.offline:
+            raise CacheMiss(key)
+    limiter = limiter or HostLimiter()
+    with limiter(WIKIPEDIA_HOST), traced(tracer, 'wptools', kind='http', title=title):
+        page = wptools.page(title, silent=True).get(show=False, timeout=timeout)
+    images = page.data['image']
+    if cache is not None:
+        cache.put_json(key, images)
+    return images
+
+
+# Leading bytes of the raster formats the notebook could open with PIL
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'II*\x00', 'tif'),
+    (b'MM\x00*', 'tif'),
+    (b'BM', 'bmp'),
+]
+
+
+def sniff_format(head):
+    """File extension for an image from its first bytes, or None."""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    for signature, image_file_format in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_file_format
+    return None
+
+
+def write_poster(chunks, file_stem):
+    """Write an image body to ``file_stem`` plus its real extension and return the path.
+
+    The chunks go straight to disk, so the stored bytes are exactly what the
+    server sent. The extension comes from the magic bytes rather than the
+    URL. Nothing is decoded; see ``verify_poster`` for that.
+    """
+    tmp = file_stem + '.part'
+    head = b''
+    with open(tmp, 'wb') as f:
+        for chunk in chunks:
+            if len(head) < 16:
+                head += chunk[:16 - len(head)]
+            f.write(chunk)
+
+    image_file_format = sniff_format(head)
+    if image_file_format is None:
+        os.remove(tmp)
+        raise ValueError('cannot identify image file for ' + file_stem)
+    path = file_stem + '.' + image_file_format
+    os.replace(tmp, path)
+    return path
+
+
+def verify_poster(path):
+    """Fully decode ``path`` with PIL as an integrity check, deleting it if that fails.
+
+    Off by default in gather_posters since the decode is the expensive part.
+    """
+    from PIL import Image
+    try:
+        with Image.open(path) as i:
+            i.load()
+    except Exception:
+        os.remove(path)
+        raise
+
+
+def _read_chunks(f, chunk_size=64 * 1024):
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+        yield chunk
+
+
+def _counted(chunks, span):
+    for chunk in chunks:
+        span.add_bytes(len(chunk))
+        yield chunk
+
+
+def download_poster(session, url, file_stem, limiter, timeout=30, cache=None, revalidate=False,
+                    verify=False, chunk_size=64 * 1024, tracer=None):
+    """Stream the poster at ``url`` to disk and return the saved path."""
+    with limiter(url), traced(tracer, 'download_poster', kind='http', url=url) as span:
+        if cache is not None:
+            span.fields['source'] = 'cache'
+            with cache.fetch_file(session, url, revalidate=revalidate, timeout=timeout) as cached:
+                path = write_poster(_counted(_read_chunks(cached, chunk_size), span), file_stem)
+        else:
+            span.fields['source'] = 'http'
+            with session.get(url, timeout=timeout, stream=True) as r:
+                span.fields['status'] = r.status_code
+                r.raise_for_status()
+                path = write_poster(_counted(r.iter_content(chunk_size), span), file_stem)
+    if verify:
+        with traced(tracer, 'verify_poster'):
+            verify_poster(path)
+    return path
+
+
+def _gather_one(ranking, title, folder_name, session, limiter, timeout, cache=None, revalidate=False,
+                verify=False, lead_images=None, manifest=None, overrides=None, retries=4, tracer=None, parent=None):
+    with traced(tracer, 'title', parent=parent, ranking=int(ranking), title=title) as span:
+        row, images = _gather_title(ranking, title, folder_name, session, limiter, timeout, cache, revalidate,
+                                    verify, lead_images, manifest, overrides, retries, tracer, span)
+        span.rows_out = int(row is not None)
+    return row, images
+
+
+def _gather_title(ranking, title, folder_name, session, limiter, timeout, cache, revalidate, verify,
+                  lead_images, manifest, overrides, retries, tracer, span):
+    if manifest is not None:
+        done = manifest.completed(title)
+        if done is not None:
+            return {'ranking': int(ranking),
+                    'title': title,
+                    'poster_url': done['url']}, None
+
+    images = None
+    first_image_url = None
+    try:
+        if overrides and title in overrides:
+            images = [{'kind': 'override', 'url': overrides[title]}]
+        elif lead_images is None:
+            images = retry(lambda: get_images(title, limiter, timeout, cache, tracer), attempts=retries)
+        elif title in lead_images:
+            url = lead_images[title]
+            images = [{'kind': 'query-pageimage', 'url': url}] if url else []
+        else:
+            raise CacheMiss('pageimage:' + title)
+        # First image is usually the poster
+        first_image_url = images[0]['url']
+        file_stem = os.path.join(folder_name, str(ranking) + "_" + title)
+        path = retry(lambda: download_poster(session, first_image_url, file_stem, limiter, timeout, cache,
+                                             revalidate, verify, tracer=tracer),
+                     attempts=retries)
+        if manifest is not None:
+            manifest.record(ranking, title, 'done', first_image_url, path)
+        return {'ranking': int(ranking),
+                'title': title,
+                'poster_url': first_image_url}, None
+    # Same catch-all as the notebook loop; the error goes to image_errors,
+    # and to the trace when there is one
+    except Exception as e:
+        if tracer is None:
+            print(str(ranking) + "_" + title + ": " + str(e))
+        else:
+            span.fields['error'] = error_class(e)
+            span.fields['message'] = str(e)
+        if manifest is not None:
+            manifest.record(ranking, title, 'failed', first_image_url, error=type(e).__name__ + ': ' + str(e))
+        return None, images
+
+
+def gather_posters(title_list, folder_name, max_workers=8, per_host=4, timeout=30, session=None,
+                   cache=None, revalidate=False, verify=False, batch_size=BATCH_SIZE,
+                   manifest=None, overrides=None, retries=4, tracer=None, api_url=API_URL):
+    """Download the first image of every title in ``title_list`` into ``folder_name``.
+
+    ``max_workers`` is the number of titles in flight, ``per_host`` caps
+    concurrent requests to any single host and ``timeout`` applies to each
+    request. With a ``cache``, cached posters are only checked against the
+    server when ``revalidate`` is set. Posters are saved byte for byte;
+    ``verify`` adds a full PIL decode of each one. Returns
+    ``(df_list, image_errors)``, ordered by ranking.
+
+    Poster URLs are looked up ``batch_size`` titles per API request (see
+    gathering_wiki) at ``api_url``. ``batch_size=None`` goes back to one
+    full ``wptools.page(title).get()`` per title.
+
+    With a ``manifest`` (gathering_manifest.Manifest) titles finished by an
+    earlier run are skipped and every attempt is recorded. ``overrides`` maps
+    titles to poster URLs that replace the Wikipedia lookup. Transient HTTP
+    errors are retried up to ``retries`` times with exponential backoff.
+
+    With a ``tracer`` (gathering_trace.Tracer) the run, the lead image
+    lookup, every title and every request attempt get a trace record, and
+    failed titles are recorded there instead of printed.
+    """
+    if not os.path.exists(folder_name):
+        os.makedirs(folder_name)
+    session = session or make_session(max_workers)
+    limiter = HostLimiter(per_host)
+    overrides = overrides or {}
+
+    with traced(tracer, 'gather_posters', rows_in=len(title_list)) as run:
+        todo = [title for title in title_list
+                if title not in overrides and (manifest is None or manifest.completed(title) is None)]
+        lead_images = None
+        if batch_size:
+            lead_images = retry(lambda: resolve_lead_images(todo, session, api_url, batch_size, timeout,
+                                                            limiter=limiter, cache=cache, tracer=tracer),
+                                attempts=retries)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(_gather_one, ranking, title, folder_name, session, limiter, timeout,
+                                   cache, revalidate, verify, lead_images, manifest, overrides, retries,
+                                   tracer, run)
+                       for ranking, title in enumerate(title_list, start=1)]
+            results = [future.result() for future in futures]
+
+        df_list = []
+        image_errors = {}
+        for (ranking, title), (row, images) in zip(enumerate(title_list, start=1), results):
+            if row is not None:
+                df_list.append(row)
+            else:
+                image_errors[str(ranking) + "_" + title] = images
+        run.rows_out = len(df_list)
+    return df_list, image_errors
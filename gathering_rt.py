@@ -0,0 +1,86 @@
+"""Fast extraction of audience scores from the saved Rotten Tomatoes pages.
+
+The loop in Udacity_gathering.ipynb builds a full BeautifulSoup tree for
+every file in ``rt-html/`` to read three nodes: ``<title>``, the first
+``div.meter-value`` and the "User Ratings:" text in ``div.audience-info``.
+Here the page is streamed through lxml's ``iterparse``; elements outside
+those nodes are thrown away as soon as they are closed, and parsing stops
+once all three have been seen. Files are spread over a process pool.
+
+The resulting frame is the same as the notebook's ``df`` (and
+``df_solution.pkl``): title, audience_score and number_of_audience_ratings.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from lxml import etree
+
+TITLE_SUFFIX = ' - Rotten Tomatoes'
+AUDIENCE_INFO_CLASSES = {'audience-info', 'hidden-xs', 'superPageFontColor'}
+
+
+def _target(elem):
+    """Which of the three nodes ``elem`` is, or None."""
+    if elem.tag == 'title':
+        return 'title'
+    if elem.tag == 'div':
+        classes = set((elem.get('class') or '').split())
+        if 'meter-value' in classes:
+            return 'meter'
+        if AUDIENCE_INFO_CLASSES <= classes:
+            return 'ratings'
+    return None
+
+
+def extract_rt(path):
+    """Dict of title, audience_score and number_of_audience_ratings for one saved page."""
+    found = {}
+    open_targets = 0
+    for event, elem in etree.iterparse(path, events=('start', 'end'), html=True, encoding='utf-8'):
+        target = _target(elem)
+        if event == 'start':
+            if target:
+                open_targets += 1
+            continue
+        if target:
+            open_targets -= 1
+            # soup.find() semantics: the first match wins
+            if target not in found:
+                found[target] = ''.join(elem.itertext())
+            if len(found) == 3:
+                break
+        if open_targets == 0:
+            # nothing we need is under this element any more
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+    title = found['title'][:-len(TITLE_SUFFIX)]
+
+    meter_vals_txt = found['meter'].strip()
+    audience_score = meter_vals_txt[:len(meter_vals_txt) - 1]
+
+    ratings = found['ratings']
+    start = ratings.find("User Ratings:")
+    number_of_audience_ratings = ratings[start + 13:].strip().replace(',', '')
+
+    return {'title': title,
+            'audience_score': int(audience_score),
+            'number_of_audience_ratings': int(number_of_audience_ratings)}
+
+
+def extract_rt_folder(folder='rt-html', processes=None, chunksize=16):
+    """DataFrame of every page in ``folder``, extracted across ``processes`` workers.
+
+    ``processes=1`` runs in this process, which is quicker for a handful of
+    files.
+    """
+    paths = [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+             if name.endswith('.html')]
+    if processes == 1:
+        df_list = [extract_rt(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            df_list = list(pool.map(extract_rt, paths, chunksize=chunksize))
+    return pd.DataFrame(df_list, columns=['title', 'audience_score', 'number_of_audience_ratings'])
@@ -0,0 +1,219 @@
+"""Per-stage trace records for gathering and cleaning runs.
+
+The notebook loop shows progress with ``print(ranking)`` and failures with
+a print inside its catch-all ``except``, which says nothing about where a
+slow run spent its time. A ``Tracer`` writes one JSON line per span: a
+stage (a pipeline rule, the poster run, the lead image lookup) or a single
+HTTP request. Each record has the wall and CPU time, rows in and out, bytes
+transferred, how much the span raised the process's peak RSS, and the
+error class if the span raised.
+
+Spans nest: a span opened while another is open on the same thread is its
+child, and work handed to a thread pool names its parent explicitly. The
+``path`` of a record (``gather_posters;title;download_poster``) is its
+place in that tree. ``summarize`` totals the records per path and
+``write_folded`` writes them in the folded-stack format that flamegraph.pl
+and speedscope read, so one look shows whether a slow night was Wikipedia
+latency, the PIL decode or a pandas ``apply``.
+
+CPU time is that of the thread running the span, so a thread pool's
+workers don't bill each other. Peak RSS is process-wide: the delta is how
+far the high-water mark moved while the span was open, whichever thread
+moved it.
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, or None where it isn't available."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def error_class(exc):
+    """Qualified class name of an exception, e.g. ``requests.exceptions.ReadTimeout``."""
+    cls = type(exc)
+    if cls.__module__ == 'builtins':
+        return cls.__qualname__
+    return cls.__module__ + '.' + cls.__qualname__
+
+
+class Span:
+    """One timed stage or request; use ``traced`` or ``Tracer.span`` to make one.
+
+    ``rows_in``, ``rows_out`` and ``bytes`` can be set while the span is
+    open, and ``fields`` takes any extra values for the record. A span with
+    no tracer measures nothing and writes nothing.
+    """
+
+    def __init__(self, tracer, name, kind='stage', parent=None, rows_in=None, rows_out=None, **fields):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.parent = parent
+        self.rows_in = rows_in
+        self.rows_out = rows_out
+        self.bytes = None
+        self.fields = fields
+        self.path = name
+        self.record = None
+
+    def add_bytes(self, n):
+        self.bytes = (self.bytes or 0) + n
+
+    def __enter__(self):
+        if self.tracer is None:
+            return self
+        stack = self.tracer._stack()
+        parent = self.parent if self.parent is not None else (stack[-1] if stack else None)
+        if parent is not None and parent.tracer is not None:
+            self.path = parent.path + ';' + self.name
+        stack.append(self)
+        self._started = time.time()
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+        self._rss = peak_rss()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.tracer is None:
+            return False
+        wall = time.perf_counter() - self._wall
+        cpu = time.thread_time() - self._cpu
+        rss = peak_rss()
+        stack = self.tracer._stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        record = {'run': self.tracer.run,
+                  'name': self.name,
+                  'path': self.path,
+                  'kind': self.kind,
+                  'start': self._started,
+                  'wall_s': wall,
+                  'cpu_s': cpu,
+                  'rows_in': self.rows_in,
+                  'rows_out': self.rows_out,
+                  'bytes': self.bytes,
+                  'rss_peak_delta': None if rss is None else rss - self._rss,
+                  'error': None if exc is None else error_class(exc),
+                  'message': None if exc is None else str(exc)}
+        record.update(self.fields)
+        self.record = record
+        self.tracer.emit(record)
+        return False
+
+
+def traced(tracer, name, kind='stage', parent=None, **fields):
+    """``tracer.span(...)``, or a span that records nothing when ``tracer`` is None."""
+    return Span(tracer, name, kind, parent, **fields)
+
+
+class Tracer:
+    """Collects span records and appends them to a JSON-lines file at ``path``.
+
+    Records are also kept in ``records`` for ``summarize``. ``path=None``
+    keeps them in memory only. Safe to share between threads.
+    """
+
+    def __init__(self, path=None, run=None):
+        self.path = path
+        self.run = run or '{}-{}'.format(time.strftime('%Y%m%dT%H%M%S'), os.getpid())
+        self.records = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._file = open(path, 'a', encoding='utf-8') if path is not None else None
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def span(self, name, kind='stage', parent=None, **fields):
+        return Span(self, name, kind, parent, **fields)
+
+    def emit(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            self.records.append(record)
+            if self._file is not None:
+                self._file.write(line)
+                self._file.flush()
+
+    def close(self, folded_path=None):
+        """Close the trace file, first writing a folded-stack summary to ``folded_path`` if given."""
+        if folded_path is not None:
+            write_folded(self.records, folded_path)
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def read_trace(path, run=None):
+    """Records from a trace file, only those of ``run`` if given."""
+    records = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # a run killed mid-write can leave a partial last line
+                continue
+            if run is None or record['run'] == run:
+                records.append(record)
+    return records
+
+
+def summarize(records):
+    """Totals per span path, slowest first.
+
+    ``self_s`` is the wall time not covered by child spans; children run on
+    a thread pool can add up to more than their parent, so it is floored
+    at 0.
+    """
+    totals = {}
+    for record in records:
+        total = totals.setdefault(record['path'], {'path': record['path'], 'kind': record['kind'], 'count': 0,
+                                                   'wall_s': 0.0, 'cpu_s': 0.0, 'child_s': 0.0,
+                                                   'bytes': 0, 'errors': 0})
+        total['count'] += 1
+        total['wall_s'] += record['wall_s']
+        total['cpu_s'] += record['cpu_s']
+        total['bytes'] += record['bytes'] or 0
+        total['errors'] += record['error'] is not None
+    for record in records:
+        parent, _, _ = record['path'].rpartition(';')
+        if parent in totals:
+            totals[parent]['child_s'] += record['wall_s']
+    for total in totals.values():
+        total['self_s'] = max(0.0, total['wall_s'] - total.pop('child_s'))
+    return sorted(totals.values(), key=lambda total: total['wall_s'], reverse=True)
+
+
+def write_folded(records, path):
+    """Write ``<path> <self microseconds>`` lines, the input of flamegraph.pl and speedscope."""
+    with open(path, 'w', encoding='utf-8') as f:
+        for total in sorted(summarize(records), key=lambda total: total['path']):
+            f.write('{} {}\n'.format(total['path'], int(round(total['self_s'] * 1e6))))